@@ -0,0 +1,121 @@
+"""
+    File: bench_fake_news_ms.py
+    Author: Musa Unal
+    Course: CSC 120
+    Purpose: Benchmarks the stages of fake_news_ms.py on synthetic
+        CSV files. For every combination of row count and
+        vocabulary skew it writes a CSV in the layout of the news
+        dumps, counts it with the profiled pipeline and prints
+        the time and rate of CSV parsing, title cleaning, word
+        counting, top-n selection and sorting.
+
+    Example:
+        python bench_fake_news_ms.py --rows 100000 1000000 \\
+            --skew 0.8 1.2 --vocabulary 200000
+"""
+
+
+import argparse
+import csv
+import itertools
+import os
+import random
+import tempfile
+
+import fake_news_ms
+
+
+def write_synthetic_csv(file_name, row_count, vocabulary_size, skew,
+                        words_per_title, seed):
+    """
+    Write a CSV file with a comment header and one title per row,
+    in the fifth column like the news dumps. The title words
+    follow a Zipf distribution, and some carry punctuation.
+
+    Parameters:
+    file_name (str): The file to write.
+    row_count (int): The number of rows.
+    vocabulary_size (int): The number of distinct words.
+    skew (float): The Zipf exponent; higher means fewer words
+        make up most of the text.
+    words_per_title (int): The number of words in every title.
+    seed (int): The seed of the random generator.
+    """
+    rng = random.Random(seed)
+    words = ["word{:d}".format(i) for i in range(vocabulary_size)]
+    cum_weights = list(itertools.accumulate(
+        1 / (i + 1) ** skew for i in range(vocabulary_size)))
+    with open(file_name, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["#uuid", "ord_in_thread", "author",
+                         "published", "title"])
+        for row in range(row_count):
+            title = rng.choices(words, cum_weights=cum_weights,
+                                k=words_per_title)
+            title[0] = title[0].capitalize()
+            title[-1] += rng.choice(["", "", "?", "!", ": \"a\", b"])
+            writer.writerow([row, 0, "author", "2016-10-26",
+                             " ".join(title)])
+
+def run(row_counts, skews, vocabulary_size, words_per_title, n, seed):
+    """
+    Run the benchmark grid and print one row per combination.
+    """
+    print("{:>9} {:>5} {:>9} {:>9} {:>11} {:>9} {:>11} {:>9} {:>11} "
+          "{:>9} {:>9}".format(
+              "rows", "skew", "vocab", "parse s", "rows/s", "clean s",
+              "rows/s", "count s", "tokens/s", "select s", "sort s"))
+    directory = tempfile.mkdtemp()
+    file_name = os.path.join(directory, "titles.csv")
+    try:
+        for row_count in row_counts:
+            for skew in skews:
+                write_synthetic_csv(file_name, row_count, vocabulary_size,
+                                    skew, words_per_title, seed)
+                counts, stats = fake_news_ms.profile_count_words(
+                    [file_name])
+                fake_news_ms.profile_top_counts(
+                    counts, min(n, len(counts) - 1), stats)
+                print("{:>9d} {:>5.2f} {:>9d} {:>9.3f} {:>11.0f} "
+                      "{:>9.3f} {:>11.0f} {:>9.3f} {:>11.0f} {:>9.3f} "
+                      "{:>9.3f}".format(
+                          row_count, skew, stats["vocabulary"],
+                          stats["parse"], rate(stats["rows"],
+                                               stats["parse"]),
+                          stats["clean"], rate(stats["rows"],
+                                               stats["clean"]),
+                          stats["count"], rate(stats["tokens"],
+                                               stats["count"]),
+                          stats["select"], stats["sort"]))
+    finally:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+        os.rmdir(directory)
+
+def rate(amount, seconds):
+    return amount / seconds if seconds > 0 else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the fake_news_ms pipeline stages.")
+    parser.add_argument("--rows", type=int, nargs="+",
+                        default=[100000, 400000])
+    parser.add_argument("--skew", type=float, nargs="+",
+                        default=[0.8, 1.2])
+    parser.add_argument("--vocabulary", type=int, default=100000)
+    parser.add_argument("--words-per-title", type=int, default=10)
+    parser.add_argument("--top", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", metavar="PATH",
+                        help="only write one CSV of the first row count "
+                             "and skew to PATH")
+    args = parser.parse_args()
+    if args.output is not None:
+        write_synthetic_csv(args.output, args.rows[0], args.vocabulary,
+                            args.skew[0], args.words_per_title, args.seed)
+        return
+    run(args.rows, args.skew, args.vocabulary, args.words_per_title,
+        args.top, args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+    File: bench_writer_bot_ht.py
+    Author: Musa Unal
+    Course: CSC 120
+    Purpose: Benchmarks the Hashtable and Markov chains of
+        writer_bot_ht.py on synthetic corpora. For every
+        combination of corpus size, prefix size and initial
+        table size it times hashing, building and generating,
+        compares them with a chain kept in a Python dictionary,
+        and prints the probe statistics of the Hashtable.
+
+    Example:
+        python bench_writer_bot_ht.py --words 100000 200000 \\
+            --prefix-sizes 1 2 3 --table-sizes 1000 100000
+"""
+
+
+import argparse
+import random
+import time
+
+import writer_bot_ht
+
+
+def synthetic_corpus(word_count, vocabulary_size, seed):
+    """
+    Make a list of words whose frequencies follow a Zipf-like
+    distribution, with an occasional punctuation mark attached.
+
+    Parameters:
+    word_count (int): The number of words.
+    vocabulary_size (int): The number of distinct base words.
+    seed (int): The seed of the random generator.
+
+    Returns:
+    A list of strings.
+    """
+    rng = random.Random(seed)
+    words = ["w{:d}".format(i) for i in range(vocabulary_size)]
+    weights = [1 / (i + 1) for i in range(vocabulary_size)]
+    text = rng.choices(words, weights, k=word_count)
+    for i in range(0, word_count, 17):
+        text[i] += rng.choice(",.!?")
+    return text
+
+def timed(function, *args):
+    """
+    Call a function once and measure how long it took.
+
+    Returns:
+    A tuple of the result and the elapsed seconds.
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def build_dict_chain(text, prefix_size):
+    """
+    Build the baseline chain: a dictionary from prefix tuples
+    of words to lists of suffix words.
+    """
+    chain = {}
+    prefix = (writer_bot_ht.NONWORD,) * prefix_size
+    for word in text:
+        chain.setdefault(prefix, []).append(word)
+        prefix = prefix[1:] + (word,)
+    return chain
+
+def generate_dict_text(chain, prefix_size, word_count, rng):
+    """
+    Generate words from the baseline chain with the same
+    selection rule as generate_text.
+    """
+    prefix = (writer_bot_ht.NONWORD,) * prefix_size
+    words = []
+    for _ in range(word_count):
+        suffixes = chain.get(prefix)
+        if suffixes is None:
+            break
+        word = suffixes[rng.randint(0, len(suffixes) - 1)] \
+            if len(suffixes) > 1 else suffixes[0]
+        words.append(word)
+        if word:
+            prefix = prefix[1:] + (word,)
+    return words
+
+def hash_rates(text, prefix_size):
+    """
+    Measure how many keys per second the string hash of the
+    old joined keys and prefix_hash of word id tuples handle.
+
+    Returns:
+    A tuple of the two rates.
+    """
+    table = writer_bot_ht.Hashtable(1)
+    vocabulary = writer_bot_ht.Vocabulary()
+    ids = [vocabulary.intern(word) for word in text]
+    keys = [' '.join(text[i:i + prefix_size])
+            for i in range(len(text) - prefix_size)]
+    id_keys = [tuple(ids[i:i + prefix_size])
+               for i in range(len(ids) - prefix_size)]
+    _, string_seconds = timed(lambda: [table._hash(key) for key in keys])
+    _, id_seconds = timed(
+        lambda: [writer_bot_ht.prefix_hash(key) for key in id_keys])
+    return len(keys) / string_seconds, len(id_keys) / id_seconds
+
+def run(word_counts, prefix_sizes, table_sizes, vocabulary_size,
+        generate_count, seed):
+    """
+    Run the benchmark grid and print one row per combination.
+    """
+    print("{:>9} {:>3} {:>9} {:>11} {:>11} {:>9} {:>9} {:>9} "
+          "{:>9} {:>9} {:>6} {:>6} {:>5}".format(
+              "words", "k", "table", "str hash/s", "id hash/s",
+              "build s", "compact", "dict", "gen s", "dict gen",
+              "load", "probes", "full"))
+    for word_count in word_counts:
+        text = synthetic_corpus(word_count, vocabulary_size, seed)
+        for prefix_size in prefix_sizes:
+            string_rate, id_rate = hash_rates(text, prefix_size)
+            dict_chain, dict_seconds = timed(
+                build_dict_chain, text, prefix_size)
+            _, dict_generate_seconds = timed(
+                generate_dict_text, dict_chain, prefix_size,
+                generate_count, random.Random(seed))
+            for table_size in table_sizes:
+                chain, build_seconds = timed(
+                    writer_bot_ht.build_markov_chain, text,
+                    prefix_size, table_size,
+                    writer_bot_ht.MAX_LOAD_FACTOR, False, True)
+                _, compact_seconds = timed(
+                    writer_bot_ht.build_markov_chain, text,
+                    prefix_size, table_size,
+                    writer_bot_ht.MAX_LOAD_FACTOR, True)
+                _, generate_seconds = timed(
+                    writer_bot_ht.generate_text, chain, prefix_size,
+                    generate_count, random.Random(seed))
+                stats = chain.table.stats
+                print("{:>9d} {:>3d} {:>9d} {:>11.0f} {:>11.0f} "
+                      "{:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} "
+                      "{:>6.2f} {:>6.2f} {:>5d}".format(
+                          word_count, prefix_size, table_size,
+                          string_rate, id_rate, build_seconds,
+                          compact_seconds, dict_seconds,
+                          generate_seconds, dict_generate_seconds,
+                          chain.table.load_factor(),
+                          stats.mean_probes(), stats.full_events))
+                print("    probe lengths:", ", ".join(
+                    "{:d}: {:d}".format(probes, count) for probes, count
+                    in sorted(stats.probe_histogram.items())[:8]))
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the writer_bot_ht Markov chains.")
+    parser.add_argument("--words", type=int, nargs="+",
+                        default=[50000, 200000])
+    parser.add_argument("--prefix-sizes", type=int, nargs="+",
+                        default=[1, 2, 3])
+    parser.add_argument("--table-sizes", type=int, nargs="+",
+                        default=[1000, 100000])
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--generate", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=writer_bot_ht.SEED)
+    args = parser.parse_args()
+    run(args.words, args.prefix_sizes, args.table_sizes,
+        args.vocabulary, args.generate, args.seed)
+
+if __name__ == "__main__":
+    main()
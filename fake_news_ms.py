@@ -4,21 +4,46 @@ File: fake_news_ms.py
     Purpose: It reads csv file and gets all lines, processes 
             it according to repeated words and n number.  
              It sorts the Word objects using the merge sort 
-             algorithm implemented in the merge_sort and merge 
-             functions. Then, it returns filename, n number, and
+             algorithm implemented in the merge_sort and 
+             merge_runs functions. Then, it returns filename, n number, and
             repeated words in the file.
     Course: CSC120
     Assignment: PA-long-08-extra
 """
 
 
+import argparse
+import concurrent.futures
 import csv
+import glob
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import math
+import os
 import string
+import sys
+import time
+
+READ_BUFFER_SIZE = 1 << 20
+SHARD_BYTES = 1 << 26
+FINGERPRINT_BYTES = 1 << 12
+PROFILE_BATCH_ROWS = 10000
+
+# Turns every punctuation character into a space in one pass.
+PUNCTUATION_TABLE = str.maketrans(
+    string.punctuation, " " * len(string.punctuation))
 
 class Word:
-    def __init__(self, word):
+    # No per-instance __dict__, there can be millions of words.
+    __slots__ = ("_word", "_count")
+
+    def __init__(self, word, count=1):
         self._word = word
-        self._count = 1
+        self._count = count
 
     def word(self):
         return self._word
@@ -26,8 +51,8 @@ class Word:
     def count(self):
         return self._count
     
-    def incr(self):
-        self._count += 1
+    def incr(self, count=1):
+        self._count += count
 
     def __lt__(self, other):
         return self._word < other._word
@@ -35,17 +60,105 @@ class Word:
     def __str__(self):
         return "{} : {:d}".format(self._word, self._count)
     
+class SpaceSaving:
+    # Approximate counts of the most frequent words in fixed memory
+    # (Metwally et al., Space-Saving). At most ceil(1 / epsilon) words
+    # are kept. A new word replaces the one with the lowest count and
+    # takes over that count, which it records as its error. After N
+    # words a kept count is never too low and at most epsilon * N too
+    # high, and every word seen more than epsilon * N times is kept.
+    def __init__(self, epsilon):
+        if not 0 < epsilon < 1:
+            raise ValueError("epsilon must be between 0 and 1")
+        self._capacity = math.ceil(1 / epsilon)
+        self._counts = {}
+        self._errors = {}
+        # (count, word) for every kept word. Counts grow without
+        # updating the heap, so an entry may be lower than the real
+        # count; evict fixes such entries when it pops them.
+        self._heap = []
+        self._total = 0
+
+    def add(self, word):
+        self._total += 1
+        counts = self._counts
+        if word in counts:
+            counts[word] += 1
+            return
+        count = 0
+        if len(counts) >= self._capacity:
+            count = self.evict()
+        counts[word] = count + 1
+        self._errors[word] = count
+        heapq.heappush(self._heap, (count + 1, word))
+
+    def evict(self):
+        heap = self._heap
+        counts = self._counts
+        while True:
+            count, word = heap[0]
+            if counts[word] == count:
+                heapq.heappop(heap)
+                del counts[word]
+                del self._errors[word]
+                return count
+            heapq.heapreplace(heap, (counts[word], word))
+
+    def counts(self):
+        return self._counts
+
+    def error(self, word):
+        return self._errors.get(word, 0)
+
+    def total(self):
+        return self._total
+
+def count_words_approximately(file_names, epsilon):
+    summary = SpaceSaving(epsilon)
+    for words in clean_titles(iter_titles(file_names)):
+        for word in words:
+            summary.add(word)
+    return summary
+
 def merge_sort(words_list):
-    if len(words_list) <= 1:
+    # Bottom-up merge sort by higher count, then by word. The keys
+    # are computed once, and the runs of indices are merged back
+    # and forth between two buffers instead of slicing new lists.
+    size = len(words_list)
+    if size <= 1:
         return words_list
-    mid = len(words_list) // 2
-    left = words_list[:mid]
-    right = words_list[mid:]
-    
-    left = merge_sort(left)
-    right = merge_sort(right)
-    
-    return merge(left, right)
+    keys = [sort_key(word) for word in words_list]
+    source = list(range(size))
+    target = [0] * size
+    width = 1
+    while width < size:
+        for start in range(0, size, 2 * width):
+            mid = min(start + width, size)
+            end = min(start + 2 * width, size)
+            merge_runs(keys, source, target, start, mid, end)
+        source, target = target, source
+        width *= 2
+    return [words_list[index] for index in source]
+
+def sort_key(word):
+    return (-word.count(), word.word())
+
+def merge_runs(keys, source, target, start, mid, end):
+    left = start
+    right = mid
+    out = start
+    while left < mid and right < end:
+        if keys[source[left]] < keys[source[right]]:
+            target[out] = source[left]
+            left += 1
+        else:
+            target[out] = source[right]
+            right += 1
+        out += 1
+    if left < mid:
+        target[out:end] = source[left:mid]
+    else:
+        target[out:end] = source[right:end]
 
 def merge(left, right):
     result = []
@@ -53,100 +166,556 @@ def merge(left, right):
     return result
 
 def merge_lists(left, right, result, left_index=0, right_index=0):
-    if left_index == len(left):
-        result.extend(right[right_index:])
-        return
-    if right_index == len(right):
-        result.extend(left[left_index:])
-        return
-    if (left[left_index].count() > right[right_index].count() or
-       (left[left_index].count() == right[right_index].count() and
-        left[left_index] < right[right_index])):
-        result.append(left[left_index])
-        merge_lists(left, right, result, left_index + 1, right_index)
-    else:
-        result.append(right[right_index])
-        merge_lists(left, right, result, left_index, right_index + 1)
+    while left_index < len(left) and right_index < len(right):
+        if (left[left_index].count() > right[right_index].count() or
+           (left[left_index].count() == right[right_index].count() and
+            left[left_index] < right[right_index])):
+            result.append(left[left_index])
+            left_index += 1
+        else:
+            result.append(right[right_index])
+            right_index += 1
+    result.extend(left[left_index:])
+    result.extend(right[right_index:])
 
-def read_and_process_file(file_name, words_list):
-    file = open(file_name, mode='r')
-    csvreader = csv.reader(file)
+def read_and_process_file(file_name, words_list, words_index=None):
+    # file_name may also be a list of file names and glob patterns.
+    # The words are counted by count_words and the counts added to
+    # words_list, which gets a new Word for every new word;
+    # words_index maps each word to its Word object in words_list.
+    if words_index is None:
+        words_index = index_words(words_list)
+    file_names = [file_name] if isinstance(file_name, str) else file_name
+    for word, count in count_words(file_names).items():
+        word_object = words_index.get(word)
+        if word_object is not None:
+            word_object.incr(count)
+        else:
+            word_object = Word(word, count)
+            words_list.append(word_object)
+            words_index[word] = word_object
 
-    def read_lines(csvreader, words_list):
-        line = next(csvreader, None)
-        if line is None:
-            return
-        if not line[0].startswith("#"):
-            title = line[4]
-            clean_and_update_words(title, words_list)
-        read_lines(csvreader, words_list)
+def count_words(file_names):
+    # Counts into a plain dictionary from word to count; Word objects
+    # are only made for the words that get printed, see top_counts.
+    # The exact counting modes all count with count_cleaned;
+    # --approximate adds the same cleaned words to a SpaceSaving
+    # summary instead.
+    counts = {}
+    for file_name in expand_file_names(file_names):
+        file = open_csv(file_name)
+        count_rows(file, counts)
+        file.close()
+    return counts
+
+def iter_titles(file_names):
+    # Streams the titles of every row that is not a comment, one
+    # file after another, so memory does not grow with the input.
+    for file_name in expand_file_names(file_names):
+        file = open_csv(file_name)
+        yield from file_titles(file)
+        file.close()
+
+def file_titles(file):
+    for line in csv.reader(file):
+        if line and not line[0].startswith("#"):
+            yield line[4]
+
+def expand_file_names(patterns):
+    file_names = []
+    for pattern in patterns:
+        if os.path.exists(pattern):
+            file_names.append(pattern)
+        else:
+            # A pattern that matches nothing is kept, so opening it
+            # reports the missing file.
+            file_names.extend(sorted(glob.glob(pattern)) or [pattern])
+    return file_names
+
+def open_csv(file_name):
+    if file_name.endswith(".gz"):
+        return gzip.open(file_name, mode='rt')
+    return open(file_name, mode='r', buffering=READ_BUFFER_SIZE)
 
-    read_lines(csvreader, words_list)
+def count_words_parallel(file_names, jobs=None):
+    # Map-reduce counting: every file is cut into byte ranges that
+    # start at a row, each range is counted in a worker process,
+    # and the partial counts are added up. Returns a dictionary
+    # from word to count.
+    shards = []
+    for file_name in expand_file_names(file_names):
+        shards.extend(shard_ranges(file_name, jobs or os.cpu_count() or 1))
+    counts = {}
+    if not shards:
+        return counts
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        for shard_counts in executor.map(count_shard, *zip(*shards)):
+            for word, count in shard_counts.items():
+                counts[word] = counts.get(word, 0) + count
+    return counts
+
+def shard_ranges(file_name, shards):
+    # Cuts a CSV file into at least `shards` byte ranges of at most
+    # about SHARD_BYTES, each ending where a row ends as found by
+    # iter_row_blocks. Gzip files cannot be cut and stay whole.
+    if file_name.endswith(".gz"):
+        return [(file_name, 0, None)]
+    size = os.path.getsize(file_name)
+    shards = max(shards, -(-size // SHARD_BYTES))
+    offsets = [0]
+    position = 0
+    # Reads of a quarter shard put every cut near its target.
+    read_size = max(min(READ_BUFFER_SIZE, size // (4 * shards)), 1)
+    file = open(file_name, mode='rb')
+    try:
+        for block, complete in iter_row_blocks(file, read_size):
+            position += len(block)
+            if complete and position >= size * len(offsets) // shards:
+                offsets.append(position)
+                if len(offsets) == shards:
+                    break
+    except ValueError:
+        # A quoted field that is never closed: csv.reader reads the
+        # rest of the file as one row, so it stays one range.
+        pass
     file.close()
+    offsets.append(size)
+    return [(file_name, start, end)
+            for start, end in zip(offsets, offsets[1:]) if end > start]
 
-def process_title(title, index, result):
-    if index == len(title):
-        return result
-    char = title[index]
-    if char in string.punctuation:
-        result += " "
+def count_shard(file_name, start, end):
+    # Counts the words of one byte range, or of the whole file when
+    # end is None. Runs in a worker process, reading the range a
+    # buffer at a time.
+    if end is None:
+        file = open_csv(file_name)
+    else:
+        raw = open(file_name, mode='rb', buffering=0)
+        raw.seek(start)
+        # Decoded the same way open(file_name, mode='r') would.
+        file = io.TextIOWrapper(io.BufferedReader(
+            ByteRange(raw, end - start), READ_BUFFER_SIZE))
+    counts = {}
+    count_rows(file, counts)
+    file.close()
+    return counts
+
+class ByteRange(io.RawIOBase):
+    # Reads at most size bytes of a raw binary file, from where the
+    # file is, and closes the file when closed.
+    def __init__(self, file, size):
+        self._file = file
+        self._remaining = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        count = self._file.readinto(memoryview(buffer)[:size])
+        self._remaining -= count
+        return count
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+def decode_rows(data):
+    # Decoded the same way open(file_name, mode='r') would.
+    return io.TextIOWrapper(io.BytesIO(data))
+
+def count_rows(file, counts):
+    count_cleaned(clean_titles(file_titles(file)), counts)
+
+def count_cleaned(cleaned, counts):
+    for words in cleaned:
+        for word in words:
+            counts[word] = counts.get(word, 0) + 1
+
+def uncount_rows(file, counts):
+    # Takes back what count_rows counted for the same rows.
+    for words in clean_titles(file_titles(file)):
+        for word in words:
+            counts[word] -= 1
+            if not counts[word]:
+                del counts[word]
+
+def load_index(index_path):
+    # The index keeps the word counts and, for every file, how many
+    # bytes of it are already counted. A missing index is empty.
+    if not os.path.exists(index_path):
+        return {"counts": {}, "files": {}}
+    with open(index_path, mode='r') as file:
+        return json.load(file)
+
+def save_index(index, index_path):
+    # Written next to the old index and then moved over it, so an
+    # interrupted run leaves the previous index intact.
+    temporary = index_path + ".tmp"
+    with open(temporary, mode='w') as file:
+        json.dump(index, file)
+    os.replace(temporary, index_path)
+
+def update_index(index, file_names):
+    # Counts only the rows added to each file since the last update.
+    for file_name in expand_file_names(file_names):
+        key = os.path.abspath(file_name)
+        entry = index["files"].get(key)
+        if isinstance(entry, int):
+            # Indexes written before the digests were kept hold only
+            # the offset, which is taken on trust.
+            entry = {"offset": entry, "tail": 0, "digest": None}
+        index["files"][key] = ingest_rows(file_name, entry, index["counts"])
+    return index
+
+def ingest_rows(file_name, entry, counts):
+    # Counts the rows of a file that its index entry does not cover
+    # yet and returns the new entry, or the first entry if entry is
+    # None. An entry holds the offset after the last complete row,
+    # the size of the counted tail after it and a digest of the bytes
+    # before the end of the tail. A row is complete once its line
+    # break, outside any quoted field, is written. A last row without
+    # one is counted as well, since the file may be finished, and
+    # taken back when the file has grown; one too short to have a
+    # title is left for the next update. A file whose digest no
+    # longer matches was replaced, and is counted again from the
+    # start.
+    if file_name.endswith(".gz"):
+        file = gzip.open(file_name, mode='rb')
     else:
-        result += char
-    return process_title(title, index + 1, result)
+        file = open(file_name, mode='rb')
+    try:
+        offset, tail = 0, 0
+        if entry is not None:
+            offset, tail = entry["offset"], entry["tail"]
+            if (entry["digest"] is not None and
+                    file_digest(file, offset + tail) != entry["digest"]):
+                print("{}: changed since the last update, counted again "
+                      "from the start".format(file_name), file=sys.stderr)
+                offset, tail = 0, 0
+            elif tail:
+                if not file.read(1):
+                    return entry
+                file.seek(offset)
+                uncount_rows(decode_rows(file.read(tail)), counts)
+        file.seek(offset)
+        tail = 0
+        for block, complete in iter_row_blocks(file):
+            if complete:
+                count_rows(decode_rows(block), counts)
+                offset += len(block)
+                continue
+            tail_counts = {}
+            try:
+                count_rows(decode_rows(block), tail_counts)
+            except (IndexError, csv.Error):
+                print("{}: {:d} bytes of an unfinished row are left for "
+                      "the next update".format(file_name, len(block)),
+                      file=sys.stderr)
+                break
+            for word, count in tail_counts.items():
+                counts[word] = counts.get(word, 0) + count
+            tail = len(block)
+        return {"offset": offset, "tail": tail,
+                "digest": file_digest(file, offset + tail)}
+    except ValueError as error:
+        raise ValueError("{}: {}".format(file_name, error)) from None
+    finally:
+        file.close()
+
+def file_digest(file, end):
+    # A digest of the FINGERPRINT_BYTES bytes of a binary file before
+    # byte end, leaving the file at end. A file shorter than end has
+    # a different digest than it had when it was end bytes long.
+    start = max(end - FINGERPRINT_BYTES, 0)
+    file.seek(start)
+    return hashlib.sha256(file.read(end - start)).hexdigest()
+
+def iter_row_blocks(file, read_size=READ_BUFFER_SIZE):
+    # Reads a binary CSV file from the start of a row, read_size
+    # bytes at a time, and yields
+    # (block, True) for blocks of bytes that end where a row ends.
+    # Bytes after the last row end are yielded as (rest, False).
+    # When no row ends in a read, the next read is twice as long,
+    # so a long row is scanned a bounded number of times. Raises
+    # ValueError when SHARD_BYTES pass without a row end, as after
+    # a quote that opens a field and is never closed.
+    pending = b""
+    size = read_size
+    while True:
+        chunk = file.read(size)
+        if not chunk:
+            break
+        data = pending + chunk
+        end = last_row_end(data)
+        if end:
+            yield data[:end], True
+            pending = data[end:]
+            size = read_size
+        else:
+            if len(data) > SHARD_BYTES:
+                raise ValueError("no row ends in the {:d} bytes after "
+                                 "byte {:d}".format(len(data),
+                                                    file.tell() - len(data)))
+            pending = data
+            size *= 2
+    if pending:
+        yield pending, False
+
+def last_row_end(data):
+    # The offset after the last line break in data that ends a CSV
+    # row, or 0 if no row ends in data, which must start at a row.
+    # As the files are read with universal newlines, a row ends at
+    # "\n", "\r\n" or a bare "\r"; a "\r" at the end of data may be
+    # the first half of "\r\n" and is left for the next read. As in
+    # csv.reader, a quote opens a quoted field only at the start of a
+    # field, elsewhere it is an ordinary character, and inside a
+    # quoted field two quotes stand for one.
+    end = 0
+    position = 0
+    size = len(data)
+    while True:
+        quote = data.find(b'"', position)
+        while quote > 0 and data[quote - 1] not in b",\n\r":
+            quote = data.find(b'"', quote + 1)
+        # Everything from position to the quote is outside quotes.
+        stop = size if quote < 0 else quote
+        newline = data.rfind(b"\n", position, stop)
+        carriage = data.rfind(b"\r", position, stop)
+        if carriage == size - 1:
+            carriage = data.rfind(b"\r", position, carriage)
+        # A "\r" before the last "\n" is at most the start of "\r\n".
+        newline = max(newline, carriage)
+        if newline >= 0:
+            end = newline + 1
+        if quote < 0:
+            return end
+        position = quote + 1
+        while True:
+            close = data.find(b'"', position)
+            if close < 0 or close + 1 == size:
+                # The quoted field goes on past the end of data.
+                return end
+            if data[close + 1] != ord('"'):
+                break
+            position = close + 2
+        position = close + 1
+
+def index_words(words_list):
+    return {word.word(): word for word in words_list}
+
+def process_title(title, index, result):
+    return result + title[index:].translate(PUNCTUATION_TABLE)
+
+def clean_title(title):
+    # The lower-cased words longer than two characters that get counted.
+    words = process_title(title, 0, "").split()
+    return [word for word in map(str.lower, words) if len(word) > 2]
 
-def clean_and_update_words(title, words_list):
-    cleaned_title = process_title(title, 0, "")
-    words = cleaned_title.split()
-    update_words(words, 0, words_list)
+def clean_titles(titles):
+    return map(clean_title, titles)
 
-def update_words(words, index, words_list):
-    if index == len(words):
+def clean_and_update_words(title, words_list, words_index=None):
+    for word in clean_title(title):
+        update_count(word, words_list, words_index)
+
+def update_words(words, index, words_list, words_index=None):
+    for word in words[index:]:
+        word = word.lower()
+        if len(word) > 2:
+            update_count(word, words_list, words_index)
+
+def update_count(word, words_list, words_index=None):
+    if words_index is None:
+        index = find_word_index(words_list, 0, word)
+        if index != -1:
+            words_list[index].incr()
+        else:
+            words_list.append(Word(word))
         return
-    word = words[index].lower()
-    if len(word) > 2:
-        update_count(word, words_list)
-    update_words(words, index + 1, words_list)
-
-def update_count(word, words_list):
-    index = find_word_index(words_list, 0, word)
-    if index != -1:
-        words_list[index].incr()
+    word_object = words_index.get(word)
+    if word_object is not None:
+        word_object.incr()
     else:
-        words_list.append(Word(word))
+        word_object = Word(word)
+        words_list.append(word_object)
+        words_index[word] = word_object
 
 def find_word_index(words_list, index, word):
-    if index == len(words_list):
-        return -1
-    if words_list[index].word() == word:
-        return index
-    return find_word_index(words_list, index + 1, word)
+    while index < len(words_list):
+        if words_list[index].word() == word:
+            return index
+        index += 1
+    return -1
+
+def top_words(words_list, n):
+    # The words print_upto_count prints after a full sort, that is
+    # every word counted at least as often as the word at index n,
+    # in sorted order. A heap of n + 1 words finds that count in
+    # O(V log n), and only the words that reach it get sorted.
+    if n < 0:
+        n += len(words_list)
+    if not 0 <= n < len(words_list):
+        raise IndexError("list index out of range")
+    count = heapq.nsmallest(n + 1, words_list, key=sort_key)[n].count()
+    return merge_sort([word for word in words_list if word.count() >= count])
+
+def top_counts(counts, n):
+    # The words print_upto_count prints after a full sort, that is
+    # every word counted at least as often as the word at index n,
+    # in sorted order. A heap of n + 1 words finds that count in
+    # O(V log n), and only the words that reach it become Word
+    # objects and get sorted.
+    return merge_sort(words_reaching(counts, count_threshold(counts, n)))
+
+def count_threshold(counts, n):
+    # The count of the word at index n of the sorted words.
+    if n < 0:
+        n += len(counts)
+    if not 0 <= n < len(counts):
+        raise IndexError("list index out of range")
+    return heapq.nsmallest(n + 1, counts.items(), key=count_key)[n][1]
+
+def words_reaching(counts, count):
+    return [Word(word, word_count) for word, word_count in counts.items()
+            if word_count >= count]
+
+def count_key(item):
+    return (-item[1], item[0])
+
+def profile_count_words(file_names, stats=None, clock=time.perf_counter):
+    # count_words with every stage timed: reading and parsing the CSV,
+    # cleaning the titles (process_title) and counting the words.
+    # Rows go through the stages in batches so the clock is read a
+    # few times per batch, not per word. Returns the counts and the
+    # stats dictionary, which profile_top_counts and print_profile
+    # take as well.
+    if stats is None:
+        stats = {"rows": 0, "tokens": 0, "vocabulary": 0, "parse": 0.0,
+                 "clean": 0.0, "count": 0.0, "select": 0.0, "sort": 0.0}
+    counts = {}
+    for file_name in expand_file_names(file_names):
+        start = clock()
+        file = open_csv(file_name)
+        titles = file_titles(file)
+        while True:
+            batch = list(itertools.islice(titles, PROFILE_BATCH_ROWS))
+            parsed = clock()
+            cleaned = list(clean_titles(batch))
+            clean = clock()
+            count_cleaned(cleaned, counts)
+            end = clock()
+            stats["tokens"] += sum(map(len, cleaned))
+            stats["rows"] += len(batch)
+            stats["parse"] += parsed - start
+            stats["clean"] += clean - parsed
+            stats["count"] += end - clean
+            if not batch:
+                break
+            start = end
+        file.close()
+    stats["vocabulary"] = len(counts)
+    return counts, stats
+
+def profile_top_counts(counts, n, stats, clock=time.perf_counter):
+    # top_counts with the heap selection and merge_sort timed.
+    start = clock()
+    words_list = words_reaching(counts, count_threshold(counts, n))
+    selected = clock()
+    words_list = merge_sort(words_list)
+    stats["select"] += selected - start
+    stats["sort"] += clock() - selected
+    stats["sorted"] = len(words_list)
+    return words_list
+
+def print_profile(stats, file=sys.stderr):
+    print("rows: {:d}, tokens: {:d}, vocabulary: {:d}".format(
+        stats["rows"], stats["tokens"], stats["vocabulary"]), file=file)
+    rates = [("parse", stats["rows"], "rows"),
+             ("clean", stats["rows"], "rows"),
+             ("count", stats["tokens"], "tokens")]
+    for stage, amount, unit in rates:
+        seconds = stats[stage]
+        rate = amount / seconds if seconds > 0 else 0.0
+        print("{:>6}: {:8.3f} s {:12.0f} {}/s".format(
+            stage, seconds, rate, unit), file=file)
+    for stage in ("select", "sort"):
+        print("{:>6}: {:8.3f} s".format(stage, stats[stage]), file=file)
+    if "sorted" in stats:
+        print("sorted: {:d} words".format(stats["sorted"]), file=file)
 
 def print_upto_count(words_list, n, count, filename, index=0):
     if index == 0:
         print("File:", "N:")
-    if index == len(words_list) or words_list[index].count() < count:
-        return
-    print(words_list[index])
-    print_upto_count(words_list, n, count, filename, index + 1)
+    while index < len(words_list) and words_list[index].count() >= count:
+        print(words_list[index])
+        index += 1
 
     
 
 
 
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Count the words in the titles of CSV files.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--jobs", type=int, metavar="N",
+        help="count with N worker processes")
+    mode.add_argument(
+        "--index", metavar="PATH",
+        help="keep the counts in PATH and only count rows added "
+             "since the last run; a file that was replaced is counted "
+             "again from the start")
+    mode.add_argument(
+        "--approximate", type=float, metavar="EPSILON",
+        help="keep only about 1/EPSILON words; counts may be up to "
+             "EPSILON times the number of words counted too high")
+    mode.add_argument(
+        "--profile", action="store_true",
+        help="time every stage and print the timings to stderr")
+    args = parser.parse_args(argv)
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("N must be at least 1")
+    if args.approximate is not None and not 0 < args.approximate < 1:
+        parser.error("EPSILON must be between 0 and 1")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
     filename = input().strip()
-    words_list = []
-    read_and_process_file(filename, words_list)
+    # Several files or glob patterns can be given, separated by spaces.
+    file_names = [filename] if os.path.exists(filename) else filename.split()
+    if args.index is not None:
+        index = update_index(load_index(args.index), file_names)
+        save_index(index, args.index)
+        counts = index["counts"]
+    elif args.profile:
+        counts, stats = profile_count_words(file_names)
+    elif args.approximate is not None:
+        counts = count_words_approximately(
+            file_names, args.approximate).counts()
+    elif args.jobs is not None:
+        counts = count_words_parallel(file_names, args.jobs)
+    else:
+        counts = count_words(file_names)
 
     n = int(input())
-    words_list = merge_sort(words_list)
     
-    if n <= len(words_list):
-        count = words_list[n].count()
+    if n <= len(counts):
+        if args.profile:
+            words_list = profile_top_counts(counts, n, stats)
+        else:
+            words_list = top_counts(counts, n)
+        count = words_list[-1].count()
         print_upto_count(words_list, n, count, filename)
     else:
         print("n is out of bounds")
+    if args.profile:
+        print_profile(stats)
 
         
         
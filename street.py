@@ -8,6 +8,119 @@ Course: CSC120
 Assignment: PA-long-08 --redo
 """
 
+import bisect
+import functools
+import itertools
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# The number of distinct rows kept by each of the row caches
+# below. Streets repeat the same few kinds of element, so a
+# small cache serves nearly every row.
+ROW_CACHE_SIZE = 4096
+
+# How many characters of a street file are read at a time.
+READ_CHUNK_SIZE = 1 << 16
+
+# Above this level every element draws rows of one length: a
+# park is only as wide as its top border there, and buildings
+# and empty lots are always as wide as they are.
+UNIFORM_LEVEL = 5
+
+
+@functools.lru_cache(maxsize=ROW_CACHE_SIZE)
+def spaces(count):
+    """Returns a row of spaces, shared between all elements.
+
+    Parameters:
+        count (int): The number of spaces; a negative count
+            gives an empty row.
+
+    Returns:
+        str: The row of spaces.
+    """
+    return ' ' * count
+
+
+@functools.lru_cache(maxsize=ROW_CACHE_SIZE)
+def building_row(width, brick):
+    """Returns a building row of the given width tiled with
+    the brick pattern, shared between all buildings alike.
+
+    Parameters:
+        width (int): The width of the building.
+        brick (str): The brick pattern.
+
+    Returns:
+        str: The row of bricks.
+    """
+    return (brick * (width // len(brick) + 1))[:width]
+
+
+@functools.lru_cache(maxsize=ROW_CACHE_SIZE)
+def tree_row(width, foliage, layer):
+    """Returns one layer of a park's tree, shared between all
+    parks alike.
+
+    Parameters:
+        width (int): The width of the park.
+        foliage (str): The foliage pattern.
+        layer (int): The tree layer, 0 and 1 for the trunk and
+            2 to 4 for the foliage.
+
+    Returns:
+        str: The row of the tree, or None for any other layer.
+    """
+    if layer == 4:
+        # Top of the foliage (1 foliage character)
+        return centered_row(width, foliage)
+    elif layer == 3:
+        # Middle of the foliage (3 foliage characters)
+        return centered_row(width, foliage * 3)
+    elif layer == 2:
+        # Base of the foliage (5 foliage characters)
+        return centered_row(width, foliage * 5)
+    elif layer in [0, 1]:
+        # Trunk (at heights 0 and 1)
+        trunk_space = ' ' * ((width - 1) // 2)
+        return trunk_space + '|' + trunk_space
+
+
+def centered_row(width, s):
+    """Centers a string within the given width.
+
+    Parameters:
+        width (int): The width to center in.
+        s (str): The string to be centered.
+
+    Returns:
+        str: The centered string.
+    """
+    padding = (width - len(s)) // 2
+    return ' ' * padding + s + ' ' * padding
+
+
+@functools.lru_cache(maxsize=ROW_CACHE_SIZE)
+def trash_row(width, trash):
+    """Returns the ground row of an empty lot tiled with the
+    trash pattern, shared between all empty lots alike.
+
+    Parameters:
+        width (int): The width of the empty lot.
+        trash (str): The trash pattern, with spaces for
+            underscores.
+
+    Returns:
+        str: The row of trash.
+    """
+    return (trash * (width // len(trash))
+            + trash[:width % len(trash)])
+
+
 class Building:
     """Represents a building on the street.
 
@@ -53,9 +166,8 @@ class Building:
             specified height.
         """
         if 0 <= height < self.height:
-            return (self.brick * (
-                self.width // len(self.brick) + 1))[:self.width]
-        return ' ' * self.width
+            return building_row(self.width, self.brick)
+        return spaces(self.width)
 
 
 class Park:
@@ -101,14 +213,14 @@ class Park:
         """
         if height < self.ground_height:
             # Ground
-            return  ' ' * (self.width - 2) 
+            return spaces(self.width - 2)
         elif height < self.tree_height + self.ground_height:
             # Tree
             tree_layer = height - self.ground_height
             return self.draw_tree(tree_layer)
         else:
-            # Top border
-            return ' ' + ' ' * (self.width - 2) + ' '
+            # Top border, at least the two edge spaces
+            return spaces(max(self.width, 2))
 
     def draw_tree(self, height):
         """Draw a section of the tree at the given height.
@@ -120,19 +232,7 @@ class Park:
             str: A string representing a section of
                 the tree at the specified height.
         """
-        if height == 4:
-            # Top of the foliage (1 foliage character)
-            return self.centered_string(self.foliage)
-        elif height == 3:
-            # Middle of the foliage (3 foliage characters)
-            return self.centered_string(self.foliage * 3)
-        elif height == 2:
-            # Base of the foliage (5 foliage characters)
-            return self.centered_string(self.foliage * 5)
-        elif height in [0, 1]:
-            # Trunk (at heights 0 and 1)
-            trunk_space = ' ' * ((self.width - 1) // 2)
-            return trunk_space + '|' + trunk_space
+        return tree_row(self.width, self.foliage, height)
 
     def centered_string(self, s):
         """
@@ -144,8 +244,7 @@ class Park:
         Returns:
             str: The centered string within the park's width.
         """
-        padding = (self.width - len(s)) // 2
-        return ' ' * padding + s + ' ' * padding
+        return centered_row(self.width, s)
 
 class EmptyLot:
     """Represents an empty lot on the street.
@@ -174,19 +273,16 @@ class EmptyLot:
         self.height = 1
 
     def replace_underscores_with_spaces(self, trash):
-        """Recursively replaces underscores with spaces in the string.
+        """Replaces underscores with spaces in the string.
         
         Parameters:
             trash (str): The trash pattern used to represent the
             trash in the empty lot.
-        
+
+        Returns:
+            str: The trash pattern with spaces for underscores.
         """
-        if "_" not in trash:
-            return trash
-        else:
-            index = trash.index("_")  # Find the index of the first underscore
-            trash = trash[:index] + " " + trash[index + 1:]  # Replace the underscore
-            return self.replace_underscores_with_spaces(trash)
+        return trash.replace('_', ' ')
 
     def at_height(self, height):
         """Returns a string representing the empty lot at the
@@ -204,38 +300,197 @@ class EmptyLot:
             height.
         """
         if not self.trash or height >= 1:
-            return ' ' * self.width
-        return (self.trash * (self.width // len(self.trash)) 
-                + self.trash[:self.width % len(self.trash)])
+            return spaces(self.width)
+        return trash_row(self.width, self.trash)
 
 
 def print_street_at_height(elements, height, total_width,
                            current_index=0, line=''):
-    """Prints the street at the specified height.
+    """Prints the street from the specified height down to the
+    ground, followed by the bottom border, in one write.
 
     Parameters:
         elements (list): A list of street elements 
             (Buildings, Parks, and EmptyLots).
         height (int): The height at which to print the street.
         total_width (int): The total width of the street.
-        current_index (int): The current index in the elements 
-            list. Defaults to 0.
-        line (str): The accumulated line string. Defaults to 
-            an empty string.
+        current_index (int): The index of the first element
+            drawn in the top row. Defaults to 0.
+        line (str): Text put before the elements of the top
+            row. Defaults to an empty string.
     """
-    if height < 0:
-        print('+' + '-' * total_width + '+')
-        return
-    
-    if current_index == len(elements):
-        print('|' + line + '|')
-        print_street_at_height(elements, height - 1, total_width)
-        return
-    
-    
-    line += elements[current_index].at_height(height)
-    print_street_at_height(
-        elements, height, total_width, current_index + 1, line)
+    rows = []
+    for level in range(height, -1, -1):
+        row = ''.join([element.at_height(level)
+                       for element in elements[current_index:]])
+        rows.append('|' + line + row + '|')
+        current_index = 0
+        line = ''
+    rows.append('+' + '-' * total_width + '+')
+    sys.stdout.write('\n'.join(rows) + '\n')
+
+def render_street(elements, height, total_width):
+    """Returns the whole picture of the street as main prints
+    it: the top border, an empty row, one row per height level
+    from the top down and the bottom border.
+
+    Parameters:
+        elements (list): A list of street elements
+            (Buildings, Parks, and EmptyLots).
+        height (int): The number of height levels to draw.
+        total_width (int): The total width of the street.
+
+    Returns:
+        str: The picture, every row ending in a newline.
+    """
+    rows = ['+' + '-' * total_width + '+', '|' + ' ' * total_width + '|']
+    for level in range(height - 1, -1, -1):
+        rows.append('|' + ''.join([element.at_height(level)
+                                   for element in elements]) + '|')
+    rows.append('+' + '-' * total_width + '+')
+    return '\n'.join(rows) + '\n'
+
+def render_street_numpy(elements, height, total_width):
+    """Returns the same picture as render_street, painting the
+    levels above the trees into a NumPy array of characters.
+
+    Only buildings reach above UNIFORM_LEVEL, and there every
+    column is either its building's brick or a space. The
+    columns' characters and building heights are laid out once
+    and all those levels are filled by one vectorized
+    comparison, bordered and decoded to text in one go. The few
+    lower levels, where parks draw rows of their own widths,
+    are joined from the element rows as in render_street.
+
+    Parameters:
+        elements (list): A list of street elements
+            (Buildings, Parks, and EmptyLots).
+        height (int): The number of height levels to draw.
+        total_width (int): The total width of the street.
+
+    Returns:
+        str: The picture, every row ending in a newline.
+
+    Raises:
+        ImportError: If NumPy is not installed.
+    """
+    if np is None:
+        raise ImportError("render_street_numpy needs NumPy")
+    text = ('+' + '-' * total_width + '+\n'
+            + '|' + ' ' * total_width + '|\n')
+    if height > UNIFORM_LEVEL:
+        pieces = []
+        lengths = []
+        tops = []
+        for element in elements:
+            piece = element.at_height(UNIFORM_LEVEL)
+            pieces.append(piece)
+            lengths.append(len(piece))
+            tops.append(element.height
+                        if isinstance(element, Building) else 0)
+        chars = np.frombuffer(''.join(pieces).encode('utf-32-le'),
+                              dtype='<u4')
+        column_tops = np.repeat(np.array(tops, dtype=np.int64), lengths)
+        levels = np.arange(height - 1, UNIFORM_LEVEL - 1, -1)
+        canvas = np.empty((len(levels), len(chars) + 3), dtype='<u4')
+        canvas[:, 0] = ord('|')
+        canvas[:, 1:-2] = np.where(levels[:, None] < column_tops,
+                                   chars, ord(' '))
+        canvas[:, -2] = ord('|')
+        canvas[:, -1] = ord('\n')
+        text += canvas.tobytes().decode('utf-32-le')
+    rows = []
+    for level in range(min(height, UNIFORM_LEVEL) - 1, -1, -1):
+        rows.append('|' + ''.join([element.at_height(level)
+                                   for element in elements]) + '|')
+    rows.append('+' + '-' * total_width + '+')
+    return text + '\n'.join(rows) + '\n'
+
+class StreetView:
+    """Renders horizontal windows of a street without drawing
+    the rest of it.
+
+    A row of the street is the rows of its elements side by
+    side, and a park's rows need not be as wide as the park,
+    so the view keeps the prefix sums of the row lengths for
+    each level up to UNIFORM_LEVEL. A window is found with a
+    binary search and only the elements it overlaps are drawn,
+    so its cost grows with its width, not with the street.
+
+    Attributes:
+        elements (list): The street elements.
+        height (int): The height of the tallest element, at
+            least 1.
+        total_width (int): The total width of the street.
+    """
+
+    def __init__(self, elements):
+        """Initializes a StreetView and indexes the row lengths
+        of the elements.
+
+        Parameters:
+            elements (list): A list of street elements
+                (Buildings, Parks, and EmptyLots).
+        """
+        self.elements = elements
+        self.height = get_max_height(elements)
+        self.total_width = sum_widths(elements)
+        self._offsets = []
+        for level in range(UNIFORM_LEVEL + 1):
+            lengths = [len(element.at_height(level))
+                       if isinstance(element, Park) else element.width
+                       for element in elements]
+            self._offsets.append(
+                list(itertools.accumulate(lengths, initial=0)))
+
+    def row(self, level, start, stop):
+        """Returns columns start to stop of the street row at
+        the given level, that is the same as slicing the full
+        row with [start:stop].
+
+        Parameters:
+            level (int): The height level, 0 for the ground.
+            start (int): The first column of the window.
+            stop (int): The column after the window.
+
+        Returns:
+            str: The part of the row inside the window.
+        """
+        if level < 0 or start < 0 or stop < start:
+            raise ValueError("level, start and stop must satisfy "
+                             "0 <= level and 0 <= start <= stop")
+        offsets = self._offsets[min(level, UNIFORM_LEVEL)]
+        index = bisect.bisect_right(offsets, start) - 1
+        pieces = []
+        while index < len(self.elements) and offsets[index] < stop:
+            offset = offsets[index]
+            piece = self.elements[index].at_height(level)
+            if offset < start or offsets[index + 1] > stop:
+                piece = piece[max(start - offset, 0):stop - offset]
+            pieces.append(piece)
+            index += 1
+        return ''.join(pieces)
+
+    def render(self, start, stop):
+        """Returns the picture of columns start to stop of the
+        street, laid out like render_street. The borders are
+        cut to the street's total width, the rows to the window
+        alone, so with start 0 and a stop past the end of every
+        row it is the same as render_street.
+
+        Parameters:
+            start (int): The first column of the window.
+            stop (int): The column after the window.
+
+        Returns:
+            str: The picture, every row ending in a newline.
+        """
+        width = max(min(stop, self.total_width) - start, 0)
+        rows = ['+' + '-' * width + '+', '|' + ' ' * width + '|']
+        for level in range(self.height - 1, -1, -1):
+            rows.append('|' + self.row(level, start, stop) + '|')
+        rows.append('+' + '-' * width + '+')
+        return '\n'.join(rows) + '\n'
 
 def parse_street(street_input, elements=None):
     """Parses the street input string and converts it into
@@ -253,65 +508,138 @@ def parse_street(street_input, elements=None):
     """
     if elements is None:
         elements = []
+    elements.extend(iter_street(street_input))
+    return elements
+
+def read_street(street_input):
+    """Parses the street and measures it in the same pass.
 
-    items = street_input.split()
-    if not items:
-        return elements
+    Parameters:
+        street_input (str or file): The street description, as
+            a string or an open text file.
 
-    item = items[0]
-    rest_of_street = ' '.join(items[1:])
+    Returns:
+        tuple: The list of street elements, the height of the
+        tallest element (at least 1) and the total width.
+    """
+    elements = []
+    height = 1
+    total_width = 0
+    for element in iter_street(street_input):
+        elements.append(element)
+        if element.height > height:
+            height = element.height
+        total_width += element.width
+    return elements, height, total_width
+
+def iter_street(street_input):
+    """Yields the street elements one at a time, in a single
+    pass over the input.
+
+    Parameters:
+        street_input (str or file): The street description, as
+            a string or an open text file, which is read a
+            chunk at a time.
+
+    Yields:
+        Building, Park or EmptyLot: The next street element.
+        Items of an unknown kind are skipped.
+    """
+    if isinstance(street_input, str):
+        items = street_input.split()
+    else:
+        items = iter_items(street_input)
+    for item in items:
+        element = parse_item(item)
+        if element is not None:
+            yield element
+
+def iter_items(file):
+    """Yields the whitespace separated items of a text file,
+    reading it a chunk at a time.
+
+    Parameters:
+        file (file): An open text file.
+
+    Yields:
+        str: The next item.
+    """
+    rest = ''
+    while True:
+        chunk = file.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        items = (rest + chunk).split()
+        # The last item may go on in the next chunk
+        if items and not chunk[-1].isspace():
+            rest = items.pop()
+        else:
+            rest = ''
+        yield from items
+    if rest:
+        yield rest
+
+def parse_item(item):
+    """Converts one item of the street description, such as
+    'b:5,3,x', 'p:7,*' or 'e:4,__x', into a street element.
+
+    Parameters:
+        item (str): The item.
+
+    Returns:
+        Building, Park or EmptyLot: The street element, or None
+        if the kind is unknown.
+    """
     kind, specs = item.split(':', 1)
 
     if kind == 'b':
         width, height, brick = specs.split(',')
-        elements.append(Building(int(width), int(height), brick))
+        return Building(int(width), int(height), brick)
     elif kind == 'p':
         width, foliage = specs.split(',')
-        elements.append(Park(int(width), foliage))
+        return Park(int(width), foliage)
     elif kind == 'e':
         width, trash = specs.split(',')
-        elements.append(EmptyLot(int(width), trash))
-
-    return parse_street(rest_of_street, elements)
+        return EmptyLot(int(width), trash)
+    return None
 
 def get_max_height(elements, current_max=1):
-    if not elements:
-        return current_max
-    else:
-        first, *rest = elements
-        new_max = current_max if current_max > first.height else first.height
-        return get_max_height(rest, new_max)
+    """
+    Calculate the height of the tallest element in a list.
+
+    :param elements: Iterable of objects, each having a 'height'
+        attribute
+    :param current_max: Integer, the smallest height returned
+    :return: The largest height
+    """
+    for element in elements:
+        if element.height > current_max:
+            current_max = element.height
+    return current_max
 
     
 def sum_widths(elements, current_sum=0):
     """
-    Recursively calculate the total width of elements in a list.
+    Calculate the total width of elements in a list.
 
-    :param elements: List of objects, each having a 'width' attribute
-    :param current_sum: Integer, the current total width calculated
+    :param elements: Iterable of objects, each having a 'width'
+        attribute
+    :param current_sum: Integer, the width added to the total
     :return: The total width of all elements
     """
-    if not elements:
-        return current_sum
-    else:
-        first, *rest = elements
-        return sum_widths(rest, current_sum + first.width)
+    for element in elements:
+        current_sum += element.width
+    return current_sum
 
 
 def main():
     street_input = input("Street: ")
-    elements = parse_street(street_input)
-    height = get_max_height(elements)
-    total_width = sum_widths(elements)
-
-    # Print the top border
-    print('+' + '-' * total_width + '+')
-
-    # Print the empty line above buildings
-    print('|' + ' ' * total_width + '|')
+    elements, height, total_width = read_street(street_input)
 
-    # Print the street at each height level
-    print_street_at_height(elements, height - 1, total_width)
+    # Write the borders and every height level at once, with the
+    # NumPy renderer when NumPy is installed
+    render = render_street if np is None else render_street_numpy
+    sys.stdout.write(render(elements, height, total_width))
 
 
 if __name__ == '__main__':
@@ -11,14 +11,132 @@
 """
 
 
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import mmap
+import os
 import random
+import struct
 import sys
+from array import array
 
 # Constants
 SEED = 8
 NONWORD = '@'
+MAX_LOAD_FACTOR = 0.75
+PUNCTUATION = frozenset([',', '.', '!', '?', ';', ':'])
+READ_CHUNK_SIZE = 1 << 20
+SHARD_SIZE = 200000
+GENERATE_CHUNK_SIZE = 16
+PREFIX_BASE = 1000000000000000003
+PREFIX_MODULUS = (1 << 61) - 1
+MODEL_MAGIC = b'MKV3'
+# 56 bytes, so every section of a model file starts 8-byte aligned.
+MODEL_HEADER = '=4sIIIIIQQQQ'
+MODEL_BYTE_ORDER = 0x01020304
+MODEL_COMPACT = 0
+MODEL_COMPILED = 1
 random.seed(SEED)
 
+
+def prefix_hash(word_ids):
+    """
+    Compute the hash of a sequence of word ids.
+
+    Parameters:
+    word_ids (iterable of int): The word ids of a prefix,
+        oldest first.
+
+    Returns:
+    The hash as a non-negative int.
+    """
+    return _scramble(_polynomial(word_ids))
+
+
+def _polynomial(word_ids):
+    """
+    Compute the polynomial of a sequence of word ids that
+    RollingPrefix keeps up to date.
+    """
+    p = 0
+    for word_id in word_ids:
+        p = (PREFIX_BASE * p + word_id) % PREFIX_MODULUS
+    return p
+
+
+def _scramble(p):
+    """
+    Mix the bits of a polynomial, so prefixes that share
+    words do not end up in neighbouring slots.
+    """
+    p ^= p >> 31
+    p = (p * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    return p ^ (p >> 29)
+
+
+class HashtableStats:
+    """
+    This class counts what an instrumented Hashtable does:
+    how many slots each get and put probed, how often the
+    table was resized, and how often a put was dropped
+    because the table was full.
+    """
+    def __init__(self):
+        """
+        Initialize all counters to zero.
+        """
+        self.gets = 0
+        self.puts = 0
+        self.get_probes = 0
+        self.put_probes = 0
+        self.longest_probe = 0
+        self.probe_histogram = collections.Counter()
+        self.resizes = 0
+        self.full_events = 0
+
+    def record_get(self, probes):
+        """
+        Count a get that looked at the given number of slots.
+        """
+        self.gets += 1
+        self.get_probes += probes
+        self._record_probes(probes)
+
+    def record_put(self, probes):
+        """
+        Count a put that looked at the given number of slots.
+        """
+        self.puts += 1
+        self.put_probes += probes
+        self._record_probes(probes)
+
+    def _record_probes(self, probes):
+        """
+        Add a probe length to the histogram.
+        """
+        self.probe_histogram[probes] += 1
+        if probes > self.longest_probe:
+            self.longest_probe = probes
+
+    def mean_probes(self):
+        """
+        Return the mean number of slots looked at per get or
+        put, or 0.0 before the first one.
+        """
+        operations = self.gets + self.puts
+        if operations == 0:
+            return 0.0
+        return (self.get_probes + self.put_probes) / operations
+
+    def __str__(self):
+        return ("gets: {:d} puts: {:d} mean probes: {:.2f} "
+                "longest probe: {:d} resizes: {:d} full: {:d}").format(
+                    self.gets, self.puts, self.mean_probes(),
+                    self.longest_probe, self.resizes, self.full_events)
+
+
 class Hashtable:
     """
     This class implements a simple hashtable for storing
@@ -26,76 +144,172 @@ class Hashtable:
     resolution.
 
     The constructor initializes an empty hashtable
-    of a given size.
+    of a given size. If a maximum load factor is given, the
+    table doubles its size and rehashes its keys whenever an
+    insert would push it past that load factor, so inserts
+    stay amortized O(1) and no key is ever dropped.
+
+    An instrumented hashtable keeps a HashtableStats in its
+    stats attribute; otherwise stats is None.
     """
-    def __init__(self, size):
+    def __init__(self, size, max_load_factor=None, instrument=False):
         """
         Initialize the hashtable.
 
         Parameters:
         size (int): The initial size of the hashtable.
+        max_load_factor (float): The largest allowed ratio of
+            keys to slots, between 0 and 1. None keeps the
+            size fixed.
+        instrument (bool): Whether to count probes, resizes
+            and dropped keys.
         """
+        if max_load_factor is not None:
+            if not 0 < max_load_factor < 1:
+                raise ValueError(
+                    "max_load_factor must be between 0 and 1")
+            size = max(size, 1)
         self._pairs = [None] * size
         self._size = size
+        self._count = 0
+        self._max_load_factor = max_load_factor
+        self.stats = HashtableStats() if instrument else None
 
     def _hash(self, key):
         """
-        Add a key-value pair to the hashtable.
+        Compute the slot index of a key.
 
         Parameters:
-        key (str): The key to be added.
-        value: The value associated with the key.
+        key (str or tuple of int): The key to be hashed. Tuples
+            of word ids are hashed with prefix_hash.
+
+        Returns:
+        The slot index as an int.
         """
+        if isinstance(key, tuple):
+            return prefix_hash(key) % self._size
         p = 0
         for c in key:
             p = 31 * p + ord(c)
         return p % self._size
 
-    def put(self, key, value):
+    def put(self, key, value, key_hash=None):
         """
         Add a key-value pair to the hashtable.
 
         Parameters:
-        key (str): The key to be added.
+        key (str or tuple of int): The key to be added.
         value: The value associated with the key.
+        key_hash (int): An already computed hash of the key,
+            used instead of hashing it again.
         """
-        index = self._hash(key)
+        index = self._index(key, key_hash)
         start_index = index
+        probes = 1
         while True:   # Initialize 
             if self._pairs[index] is None:
+                if self._needs_resize():
+                    self._resize(self._size * 2)
+                    self.put(key, value, key_hash)
+                    return
                 self._pairs[index] = [key, [value]] 
+                self._count += 1
+                if self.stats is not None:
+                    self.stats.record_put(probes)
                 return
             elif self._pairs[index][0] == key:  # Add to the existing list
                 if value not in self._pairs[index][1]:
                     self._pairs[index][1] += [value] 
-         
+                if self.stats is not None:
+                    self.stats.record_put(probes)
                 return
 
             index -= 1  # Decrement the index for linear probing
             if index < 0:
                 index = self._size - 1
             if index == start_index:  # Hashtable is full
+                if self.stats is not None:
+                    self.stats.record_put(probes)
+                    self.stats.full_events += 1
                 break
+            probes += 1
 
+    def _index(self, key, key_hash):
+        """
+        Find the slot where probing for a key starts.
+
+        Parameters:
+        key (str or tuple of int): The key to be looked up.
+        key_hash (int): An already computed hash of the key,
+            or None to hash the key.
+
+        Returns:
+        The slot index as an int.
+        """
+        if key_hash is None:
+            return self._hash(key)
+        return key_hash % self._size
+
+    def _needs_resize(self):
+        """
+        Check if inserting one more key would exceed the
+        maximum load factor.
+
+        Returns:
+        True if the table should grow before the insert,
+        False otherwise or if the size is fixed.
+        """
+        if self._max_load_factor is None:
+            return False
+        return self._count + 1 > self._max_load_factor * self._size
 
-    def get(self, key):
+    def _resize(self, new_size):
+        """
+        Move every key-value pair into a new table of the
+        given size.
+
+        Parameters:
+        new_size (int): The size of the new table.
+        """
+        if self.stats is not None:
+            self.stats.resizes += 1
+        old_pairs = self._pairs
+        self._pairs = [None] * new_size
+        self._size = new_size
+        for pair in old_pairs:
+            if pair is not None:
+                index = self._hash(pair[0])
+                while self._pairs[index] is not None:
+                    index = (index - 1) % self._size
+                self._pairs[index] = pair
+
+    def get(self, key, key_hash=None):
         """
         Retrieve the value associated with a given key.
 
         Parameters:
-        key (str): The key whose value is to be retrieved.
+        key (str or tuple of int): The key whose value is to
+            be retrieved.
+        key_hash (int): An already computed hash of the key,
+            used instead of hashing it again.
 
         Returns:
         The value associated with the key,
         or None if the key is not found.
         """
-        index = self._hash(key)
-        for _ in range(self._size):
+        index = self._index(key, key_hash)
+        for probes in range(1, self._size + 1):
             if self._pairs[index] is None:
+                if self.stats is not None:
+                    self.stats.record_get(probes)
                 return None
             if self._pairs[index][0] == key:
+                if self.stats is not None:
+                    self.stats.record_get(probes)
                 return self._pairs[index][1]
             index = (index - 1) % self._size
+        if self.stats is not None:
+            self.stats.record_get(self._size)
         return None
 
     def __contains__(self, key):
@@ -103,18 +317,857 @@ class Hashtable:
         Check if a key is in the hashtable.
 
         Parameters:
-        key (str): The key to be checked.
+        key (str or tuple of int): The key to be checked.
 
         Returns:
         True if the key is in the hashtable, False otherwise.
         """
         return self.get(key) is not None
 
+    def items(self):
+        """
+        Iterate over the key-value pairs in slot order.
+
+        Returns:
+        An iterator of (key, value) tuples.
+        """
+        for pair in self._pairs:
+            if pair is not None:
+                yield pair[0], pair[1]
+
+    def load_factor(self):
+        """
+        Return the ratio of stored keys to slots.
+        """
+        if self._size == 0:
+            return 0.0
+        return self._count / self._size
+
+    def __len__(self):
+        return self._count
+
     def __str__(self):
         return str(
             [pair for pair in self._pairs if pair is not None])
-        
-    
+
+
+class Vocabulary:
+    """
+    This class interns words as small integer ids, so the
+    Markov chain can work with ids instead of strings.
+    NONWORD always has the id 0.
+    """
+    def __init__(self):
+        """
+        Initialize a vocabulary that only holds NONWORD.
+        """
+        self._ids = {}
+        self._words = []
+        self.intern(NONWORD)
+
+    def intern(self, word):
+        """
+        Return the id of a word, giving it a new id if the
+        word has not been seen before.
+
+        Parameters:
+        word (str): The word to be interned.
+
+        Returns:
+        The id of the word as an int.
+        """
+        word_id = self._ids.get(word)
+        if word_id is None:
+            word_id = len(self._words)
+            self._ids[word] = word_id
+            self._words.append(word)
+        return word_id
+
+    def word(self, word_id):
+        """
+        Return the word with the given id.
+
+        Parameters:
+        word_id (int): The id of the word.
+
+        Returns:
+        The word as a str.
+        """
+        return self._words[word_id]
+
+    def __len__(self):
+        return len(self._words)
+
+
+class RollingPrefix:
+    """
+    This class holds the last prefix_size word ids of a text
+    together with their prefix_hash. Shifting a new word in
+    updates the hash in O(1) instead of re-joining and
+    re-hashing the whole prefix.
+    """
+    def __init__(self, prefix_size, word_id):
+        """
+        Initialize a prefix made of one repeated word id.
+
+        Parameters:
+        prefix_size (int): The number of words in the prefix.
+        word_id (int): The id that fills the prefix.
+        """
+        self._ids = collections.deque(
+            [word_id] * prefix_size, maxlen=prefix_size)
+        self._value = _polynomial(self._ids)
+        self._high = pow(PREFIX_BASE, prefix_size - 1, PREFIX_MODULUS)
+
+    def shift(self, word_id):
+        """
+        Drop the oldest word id and append a new one.
+
+        Parameters:
+        word_id (int): The id of the word to be appended.
+        """
+        oldest = self._ids[0]
+        self._ids.append(word_id)
+        self._value = ((self._value - oldest * self._high) * PREFIX_BASE
+                       + word_id) % PREFIX_MODULUS
+
+    def key(self):
+        """
+        Return the prefix as a tuple of word ids, usable as
+        a Hashtable key.
+        """
+        return tuple(self._ids)
+
+    def key_hash(self):
+        """
+        Return the prefix_hash of the prefix.
+        """
+        return _scramble(self._value)
+
+
+class MarkovChain:
+    """
+    This class stores a Markov chain over word ids. A Hashtable,
+    kept in the table attribute, maps every prefix, as a tuple
+    of word ids, to the list of ids of the words that followed
+    it, and a Vocabulary turns the ids back into words.
+    """
+    def __init__(self, prefix_size, hash_table_size,
+                 max_load_factor=MAX_LOAD_FACTOR, instrument=False):
+        """
+        Initialize an empty Markov chain.
+
+        Parameters:
+        prefix_size (int): The number of words in the prefix.
+        hash_table_size (int): The initial size of the hashtable.
+        max_load_factor (float): The load factor at which the
+            hashtable grows, or None to keep its size fixed.
+        instrument (bool): Whether the hashtable keeps a
+            HashtableStats.
+        """
+        self.prefix_size = prefix_size
+        self.vocabulary = Vocabulary()
+        self.table = Hashtable(
+            hash_table_size, max_load_factor, instrument)
+
+    def start(self):
+        """
+        Return the prefix every text starts from, made of
+        NONWORD only.
+        """
+        return RollingPrefix(self.prefix_size, 0)
+
+    def add(self, prefix, word_id):
+        """
+        Record that a word followed a prefix.
+
+        Parameters:
+        prefix (RollingPrefix): The prefix before the word.
+        word_id (int): The id of the word.
+        """
+        key = prefix.key()
+        key_hash = prefix.key_hash()
+        suffixes = self.table.get(key, key_hash)
+        if suffixes is not None:
+            suffixes.append(word_id)
+        else:
+            self.table.put(key, word_id, key_hash)
+
+    def suffixes(self, prefix):
+        """
+        Return the ids of the words that followed a prefix.
+
+        Parameters:
+        prefix (RollingPrefix): The prefix to be looked up.
+
+        Returns:
+        A list of word ids, or None if the prefix is unknown.
+        """
+        return self.table.get(prefix.key(), prefix.key_hash())
+
+    def choose(self, prefix, rng):
+        """
+        Pick the id of a word that followed a prefix, uniformly
+        over every time a word followed it.
+
+        Parameters:
+        prefix (RollingPrefix): The prefix to be looked up.
+        rng (random.Random): The source of randomness.
+
+        Returns:
+        A word id, or None if the prefix is unknown.
+        """
+        return _choose_uniform(self.suffixes(prefix), rng)
+
+    def items(self):
+        """
+        Iterate over the prefixes and their suffixes.
+
+        Returns:
+        An iterator of (tuple of word ids, list of word ids).
+        """
+        return self.table.items()
+
+    def __len__(self):
+        return len(self.table)
+
+
+def _choose_uniform(suffixes, rng):
+    """
+    Pick one of the suffixes, drawing a random number only
+    when there is more than one.
+
+    Parameters:
+    suffixes (sequence of int): The suffix word ids, or None.
+    rng (random.Random): The source of randomness.
+
+    Returns:
+    A word id, or None if suffixes is None.
+    """
+    if suffixes is None:
+        return None
+    if len(suffixes) > 1:
+        return suffixes[rng.randint(0, len(suffixes) - 1)]
+    return suffixes[0]
+
+
+class PrefixIndex:
+    """
+    This class numbers prefixes 0, 1, 2, ... in the order they
+    are added. The prefixes are stored back to back in one
+    array of word ids, and an open-addressing table of prefix
+    numbers (-1 for an empty slot) finds them again. It probes
+    like Hashtable and grows past MAX_LOAD_FACTOR, but holds no
+    Python object per prefix.
+
+    An index merged from stride partitions, as the parallel
+    build makes, owns the slots p, p + stride, p + 2 * stride,
+    ... for the prefixes whose hash is p modulo stride, probes
+    within them, and stores in them a number relative to
+    bases[p]. Such an index is read-only.
+    """
+    def __init__(self, prefix_size, size):
+        """
+        Initialize an empty index.
+
+        Parameters:
+        prefix_size (int): The number of words in a prefix.
+        size (int): The initial number of slots.
+        """
+        self._prefix_size = prefix_size
+        self._slots = array('q', [-1]) * max(size, 1)
+        self._words = array('I')
+        self._stride = 1
+        self._bases = array('Q', [0])
+
+    @classmethod
+    def from_arrays(cls, prefix_size, slots, words, bases=None):
+        """
+        Create an index over existing slot and word arrays,
+        such as the views of a model file.
+
+        Parameters:
+        prefix_size (int): The number of words in a prefix.
+        slots (sequence of int): The slot table.
+        words (sequence of int): The word ids of the prefixes.
+        bases (sequence of int): The first prefix number of
+            each partition, or None for an index that is not
+            partitioned.
+
+        Returns:
+        A PrefixIndex object.
+        """
+        index = cls(prefix_size, 1)
+        index._slots = slots
+        index._words = words
+        if bases is not None:
+            index._stride = len(bases)
+            index._bases = bases
+        return index
+
+    def find(self, key, key_hash):
+        """
+        Find the number of a prefix.
+
+        Parameters:
+        key (tuple of int): The word ids of the prefix.
+        key_hash (int): The prefix_hash of the key.
+
+        Returns:
+        The prefix number, or -1 if the prefix is unknown.
+        """
+        size = len(self._slots)
+        index = key_hash % size
+        stride = self._stride
+        if stride > 1:
+            for _ in range(size // stride):
+                number = self._slots[index]
+                if number < 0:
+                    return number
+                number += self._bases[index % stride]
+                if self.prefix(number) == key:
+                    return number
+                index = (index - stride) % size
+            return -1
+        for _ in range(size):
+            number = self._slots[index]
+            if number < 0 or self.prefix(number) == key:
+                return number
+            index = (index - 1) % size
+        return -1
+
+    def add(self, key, key_hash):
+        """
+        Return the number of a prefix, numbering it first if
+        it has not been added before.
+
+        Parameters:
+        key (tuple of int): The word ids of the prefix.
+        key_hash (int): The prefix_hash of the key.
+
+        Returns:
+        The prefix number as an int.
+        """
+        number = self.find(key, key_hash)
+        if number >= 0:
+            return number
+        number = len(self)
+        self._words.extend(key)
+        if number + 1 > MAX_LOAD_FACTOR * len(self._slots):
+            self._resize(len(self._slots) * 2)
+        else:
+            self._place(number, key_hash)
+        return number
+
+    def prefix(self, number):
+        """
+        Return the word ids of a prefix.
+
+        Parameters:
+        number (int): The prefix number.
+
+        Returns:
+        A tuple of word ids.
+        """
+        start = number * self._prefix_size
+        return tuple(self._words[start:start + self._prefix_size])
+
+    def _place(self, number, key_hash):
+        """
+        Put a prefix number into the first free slot for its hash.
+        """
+        size = len(self._slots)
+        index = key_hash % size
+        while self._slots[index] >= 0:
+            index = (index - 1) % size
+        self._slots[index] = number
+
+    def _resize(self, new_size):
+        """
+        Rebuild the slot table with the given number of slots.
+        """
+        self._slots = array('q', [-1]) * new_size
+        for number in range(len(self)):
+            self._place(number, prefix_hash(self.prefix(number)))
+
+    def __len__(self):
+        return len(self._words) // max(self._prefix_size, 1)
+
+
+class CompactChainBuilder:
+    """
+    This class collects the transitions of a text for a
+    CompactChain. Every word is recorded as a pair of its
+    prefix number and its word id in two flat arrays, which
+    build() then groups by prefix.
+    """
+    def __init__(self, prefix_size, hash_table_size):
+        """
+        Initialize an empty builder.
+
+        Parameters:
+        prefix_size (int): The number of words in the prefix.
+        hash_table_size (int): The initial size of the
+            prefix index.
+        """
+        self.prefix_size = prefix_size
+        self.vocabulary = Vocabulary()
+        self._index = PrefixIndex(prefix_size, hash_table_size)
+        self._prefixes = array('I')
+        self._suffixes = array('I')
+
+    def start(self):
+        """
+        Return the prefix every text starts from, made of
+        NONWORD only.
+        """
+        return RollingPrefix(self.prefix_size, 0)
+
+    def add(self, prefix, word_id):
+        """
+        Record that a word followed a prefix.
+
+        Parameters:
+        prefix (RollingPrefix): The prefix before the word.
+        word_id (int): The id of the word.
+        """
+        self._prefixes.append(
+            self._index.add(prefix.key(), prefix.key_hash()))
+        self._suffixes.append(word_id)
+
+    def build(self):
+        """
+        Group the recorded suffixes by prefix with a counting
+        sort, keeping them in text order within each prefix.
+
+        Returns:
+        A CompactChain object.
+        """
+        offsets = array('Q', [0]) * (len(self._index) + 1)
+        for number in self._prefixes:
+            offsets[number + 1] += 1
+        for number in range(len(self._index)):
+            offsets[number + 1] += offsets[number]
+        ends = offsets[:-1]
+        suffixes = array('I', [0]) * len(self._suffixes)
+        for number, word_id in zip(self._prefixes, self._suffixes):
+            suffixes[ends[number]] = word_id
+            ends[number] += 1
+        self._prefixes = array('I')
+        self._suffixes = array('I')
+        return CompactChain(self.prefix_size, self.vocabulary,
+                            self._index, offsets, suffixes)
+
+
+class CompactChain:
+    """
+    This class stores a Markov chain in flat arrays instead of
+    one Python list per prefix. The suffixes of prefix number n
+    are suffixes[offsets[n]:offsets[n + 1]], in text order, so
+    generating from it gives the same text as a MarkovChain.
+    """
+    def __init__(self, prefix_size, vocabulary, index, offsets,
+                 suffixes, file_name=None):
+        """
+        Initialize a chain from already grouped arrays.
+
+        Parameters:
+        prefix_size (int): The number of words in the prefix.
+        vocabulary (Vocabulary): The words of the chain.
+        index (PrefixIndex): The numbers of the prefixes.
+        offsets (array of int): Where the suffixes of each
+            prefix start, plus the total number of suffixes.
+        suffixes (array of int): The suffix word ids grouped
+            by prefix.
+        file_name (str): The model file the arrays are mapped
+            from, or None.
+        """
+        self.prefix_size = prefix_size
+        self.vocabulary = vocabulary
+        self.file_name = file_name
+        self._index = index
+        self._offsets = offsets
+        self._suffixes = memoryview(suffixes)
+
+    def __reduce__(self):
+        """
+        Pickle a chain loaded from a model file as its file
+        name, so other processes map the same file instead of
+        receiving a copy.
+        """
+        if self.file_name is not None:
+            return load_chain, (self.file_name,)
+        return CompactChain, (self.prefix_size, self.vocabulary,
+                              self._index, self._offsets,
+                              self._suffixes.obj)
+
+    def start(self):
+        """
+        Return the prefix every text starts from, made of
+        NONWORD only.
+        """
+        return RollingPrefix(self.prefix_size, 0)
+
+    def suffixes(self, prefix):
+        """
+        Return the ids of the words that followed a prefix.
+
+        Parameters:
+        prefix (RollingPrefix): The prefix to be looked up.
+
+        Returns:
+        A read-only sequence of word ids, or None if the
+        prefix is unknown.
+        """
+        number = self._index.find(prefix.key(), prefix.key_hash())
+        if number < 0:
+            return None
+        return self._suffixes[
+            self._offsets[number]:self._offsets[number + 1]]
+
+    def choose(self, prefix, rng):
+        """
+        Pick the id of a word that followed a prefix, uniformly
+        over every time a word followed it.
+
+        Parameters:
+        prefix (RollingPrefix): The prefix to be looked up.
+        rng (random.Random): The source of randomness.
+
+        Returns:
+        A word id, or None if the prefix is unknown.
+        """
+        return _choose_uniform(self.suffixes(prefix), rng)
+
+    def items(self):
+        """
+        Iterate over the prefixes and their suffixes in the
+        order the prefixes were first seen.
+
+        Returns:
+        An iterator of (tuple of word ids, sequence of word ids).
+        """
+        for number in range(len(self._index)):
+            yield self._index.prefix(number), self._suffixes[
+                self._offsets[number]:self._offsets[number + 1]]
+
+    def __len__(self):
+        return len(self._index)
+
+
+class CompiledChain:
+    """
+    This class stores a read-only Markov chain for fast
+    sampling. Each prefix keeps its distinct suffixes once,
+    with a Walker alias table built from how often each of
+    them followed the prefix, so a suffix is drawn in O(1)
+    with the same probabilities as a uniform pick over every
+    recorded occurrence. The random numbers are used
+    differently, so the text for a given seed differs from
+    the other chains.
+    """
+    def __init__(self, prefix_size, vocabulary, index, offsets,
+                 suffixes, probabilities, aliases, file_name=None):
+        """
+        Initialize a chain from already built alias tables.
+
+        Parameters:
+        prefix_size (int): The number of words in the prefix.
+        vocabulary (Vocabulary): The words of the chain.
+        index (PrefixIndex): The numbers of the prefixes.
+        offsets (array of int): Where the suffixes of each
+            prefix start, plus the total number of suffixes.
+        suffixes (array of int): The distinct suffix word ids
+            grouped by prefix.
+        probabilities (array of float): The probability of
+            keeping each suffix instead of its alias.
+        aliases (array of int): The position of each suffix's
+            alias within its prefix.
+        file_name (str): The model file the arrays are mapped
+            from, or None.
+        """
+        self.prefix_size = prefix_size
+        self.vocabulary = vocabulary
+        self.file_name = file_name
+        self._index = index
+        self._offsets = offsets
+        self._suffixes = suffixes
+        self._probabilities = probabilities
+        self._aliases = aliases
+
+    def __reduce__(self):
+        """
+        Pickle a chain loaded from a model file as its file
+        name, so other processes map the same file instead of
+        receiving a copy.
+        """
+        if self.file_name is not None:
+            return load_chain, (self.file_name,)
+        return CompiledChain, (self.prefix_size, self.vocabulary,
+                               self._index, self._offsets, self._suffixes,
+                               self._probabilities, self._aliases)
+
+    def start(self):
+        """
+        Return the prefix every text starts from, made of
+        NONWORD only.
+        """
+        return RollingPrefix(self.prefix_size, 0)
+
+    def choose(self, prefix, rng):
+        """
+        Pick the id of a word that followed a prefix, weighted
+        by how often it did.
+
+        Parameters:
+        prefix (RollingPrefix): The prefix to be looked up.
+        rng (random.Random): The source of randomness.
+
+        Returns:
+        A word id, or None if the prefix is unknown.
+        """
+        number = self._index.find(prefix.key(), prefix.key_hash())
+        if number < 0:
+            return None
+        start = self._offsets[number]
+        size = self._offsets[number + 1] - start
+        if size == 1:
+            return self._suffixes[start]
+        position = start + rng.randrange(size)
+        if rng.random() >= self._probabilities[position]:
+            position = start + self._aliases[position]
+        return self._suffixes[position]
+
+    def __len__(self):
+        return len(self._index)
+
+
+def _alias_table(counts):
+    """
+    Build a Walker alias table with Vose's method. Integer
+    weights keep the table exact until the final division.
+
+    Parameters:
+    counts (list of int): How often each outcome occurred.
+
+    Returns:
+    A tuple of a list of keep probabilities and a list of
+    alias positions.
+    """
+    total = sum(counts)
+    weights = [count * len(counts) for count in counts]
+    aliases = list(range(len(counts)))
+    small = [i for i, weight in enumerate(weights) if weight < total]
+    large = [i for i, weight in enumerate(weights) if weight >= total]
+    while small and large:
+        less = small.pop()
+        more = large.pop()
+        aliases[less] = more
+        weights[more] -= total - weights[less]
+        if weights[more] < total:
+            small.append(more)
+        else:
+            large.append(more)
+    probabilities = [weight / total for weight in weights]
+    for i in small + large:
+        probabilities[i] = 1.0
+    return probabilities, aliases
+
+
+def compile_chain(chain):
+    """
+    Turn a built Markov chain into a CompiledChain.
+
+    Parameters:
+    chain (MarkovChain or CompactChain): The chain to be
+        compiled.
+
+    Returns:
+    A CompiledChain object. Its vocabulary is a Vocabulary
+    even when the chain was loaded from a model file, so it
+    can be pickled.
+    """
+    vocabulary = chain.vocabulary
+    if isinstance(vocabulary, MappedVocabulary):
+        vocabulary = vocabulary.copy()
+    index = PrefixIndex(chain.prefix_size, len(chain))
+    offsets = array('Q', [0])
+    suffixes = array('I')
+    probabilities = array('d')
+    aliases = array('I')
+    for key, occurrences in chain.items():
+        index.add(key, prefix_hash(key))
+        counts = {}
+        for word_id in occurrences:
+            counts[word_id] = counts.get(word_id, 0) + 1
+        keep, alias = _alias_table(list(counts.values()))
+        suffixes.extend(counts)
+        probabilities.extend(keep)
+        aliases.extend(alias)
+        offsets.append(len(suffixes))
+    return CompiledChain(chain.prefix_size, vocabulary, index,
+                         offsets, suffixes, probabilities, aliases)
+
+
+class MappedVocabulary:
+    """
+    This class is a read-only Vocabulary over the words of a
+    saved model. The words stay encoded in the mapped file and
+    are only decoded when they are looked up.
+    """
+    def __init__(self, offsets, blob):
+        """
+        Initialize a vocabulary over mapped memory.
+
+        Parameters:
+        offsets (memoryview of int): Where each encoded word
+            starts in blob, plus the length of blob.
+        blob (memoryview): The UTF-8 encoded words back to back.
+        """
+        self._offsets = offsets
+        self._blob = blob
+
+    def word(self, word_id):
+        """
+        Return the word with the given id.
+
+        Parameters:
+        word_id (int): The id of the word.
+
+        Returns:
+        The word as a str.
+        """
+        return str(self._blob[
+            self._offsets[word_id]:self._offsets[word_id + 1]], 'utf-8')
+
+    def copy(self):
+        """
+        Decode every word into a Vocabulary with the same ids,
+        which no longer depends on the mapped file.
+
+        Returns:
+        A Vocabulary object.
+        """
+        vocabulary = Vocabulary()
+        for word_id in range(1, len(self)):
+            vocabulary.intern(self.word(word_id))
+        return vocabulary
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+
+def save_chain(chain, file_name):
+    """
+    Write a CompactChain or CompiledChain to a model file that
+    load_chain can map into memory without parsing it.
+
+    The file starts with MODEL_HEADER, whose last field before
+    the counts is reserved and written as 0, and is followed by
+    the vocabulary, the prefix index and the suffix arrays, each
+    padded to 8 bytes. Numbers are stored in native byte order.
+
+    Parameters:
+    chain (CompactChain or CompiledChain): The chain to be saved.
+    file_name (str): The name of the model file.
+    """
+    if isinstance(chain, CompiledChain):
+        kind = MODEL_COMPILED
+    elif isinstance(chain, CompactChain):
+        kind = MODEL_COMPACT
+    else:
+        raise TypeError("only CompactChain and CompiledChain "
+                        "can be saved, not " + type(chain).__name__)
+    vocabulary = chain.vocabulary
+    words = [vocabulary.word(word_id).encode('utf-8')
+             for word_id in range(len(vocabulary))]
+    word_offsets = array('Q', [0])
+    for word in words:
+        word_offsets.append(word_offsets[-1] + len(word))
+    index = chain._index
+    sections = [word_offsets, b''.join(words), index._slots, index._bases,
+                index._words, chain._offsets, chain._suffixes]
+    if kind == MODEL_COMPILED:
+        sections += [chain._probabilities, chain._aliases]
+    file = open(file_name, 'wb')
+    file.write(struct.pack(
+        MODEL_HEADER, MODEL_MAGIC, kind, chain.prefix_size,
+        MODEL_BYTE_ORDER, index._stride, 0, len(vocabulary), len(chain),
+        len(index._slots), len(chain._suffixes)))
+    for section in sections:
+        data = memoryview(section).cast('B')
+        file.write(data)
+        file.write(bytes(-len(data) % 8))
+    file.close()
+
+def load_chain(file_name):
+    """
+    Map a model file written by save_chain into memory. The
+    arrays of the returned chain are views of the file, so
+    loading takes no parsing and processes that load the same
+    file share its pages.
+
+    Parameters:
+    file_name (str): The name of the model file.
+
+    Returns:
+    A read-only CompactChain or CompiledChain object.
+
+    Raises:
+    ValueError: If the file is not a model file, was saved
+        with another byte order, or is truncated or longer
+        than its header says.
+    """
+    header_size = struct.calcsize(MODEL_HEADER)
+    file = open(file_name, 'rb')
+    if os.fstat(file.fileno()).st_size < header_size:
+        file.close()
+        raise ValueError(file_name + " is too short to be a Markov "
+                         "model file")
+    mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    file.close()
+    view = memoryview(mapped)
+    (magic, kind, prefix_size, byte_order, stride, _, word_count,
+     prefix_count, slot_count, suffix_count) = struct.unpack(
+         MODEL_HEADER, view[:header_size])
+    if magic != MODEL_MAGIC or kind not in (MODEL_COMPACT, MODEL_COMPILED):
+        raise ValueError(file_name + " is not a Markov model file")
+    if byte_order != MODEL_BYTE_ORDER:
+        raise ValueError(file_name + " was saved with another byte order")
+    position = header_size
+
+    def section(size, format_code=None):
+        nonlocal position
+        if position + size > len(view):
+            raise ValueError("{} is truncated: it has {:d} bytes, but "
+                             "its header needs more".format(
+                                 file_name, len(view)))
+        data = view[position:position + size]
+        position += size + (-size % 8)
+        return data if format_code is None else data.cast(format_code)
+
+    word_offsets = section(8 * (word_count + 1), 'Q')
+    blob = section(word_offsets[-1])
+    slots = section(8 * slot_count, 'q')
+    bases = section(8 * stride, 'Q')
+    prefix_words = section(4 * prefix_count * prefix_size, 'I')
+    offsets = section(8 * (prefix_count + 1), 'Q')
+    suffixes = section(4 * suffix_count, 'I')
+    if kind == MODEL_COMPILED:
+        probabilities = section(8 * suffix_count, 'd')
+        aliases = section(4 * suffix_count, 'I')
+    if position != len(view):
+        raise ValueError("{} has {:d} bytes, but its header describes "
+                         "{:d}".format(file_name, len(view), position))
+    vocabulary = MappedVocabulary(word_offsets, blob)
+    index = PrefixIndex.from_arrays(prefix_size, slots, prefix_words, bases)
+    if kind == MODEL_COMPILED:
+        return CompiledChain(prefix_size, vocabulary, index, offsets,
+                             suffixes, probabilities, aliases, file_name)
+    return CompactChain(prefix_size, vocabulary, index, offsets, suffixes,
+                        file_name)
+
+
 def read_file(file_name):
     """
     Reads the content of a file and returns a list of words,
@@ -131,76 +1184,479 @@ def read_file(file_name):
     A list of strings, where each string is a word or
     punctuation from the file.
     """
-    file = open(file_name, 'r')
-    text = []
-    for line in file:
-        words = line.split()
-        for i, word in enumerate(words):
-            if i < len(words) - 1 and \
-                words[i+1] in [',', '.', '!', '?', ';', ':']:
-                text.append(word + words[i+1])
-                words[i+1] = ""
-            elif word not in [',', '.', '!', '?', ';', ':']:
-                text.append(word)
-    file.close()
-    return text
+    return list(iter_words(file_name))
+
+def iter_words(file_name, chunk_size=READ_CHUNK_SIZE):
+    """
+    Yield the words of a file one at a time, exactly as
+    read_file would return them. The file is read in large
+    chunks, and a line cut by a chunk boundary is carried
+    over to the next chunk, so memory does not grow with
+    the size of the file.
+
+    Parameters:
+    file_name: A string representing the name of the
+    file to be read.
+    chunk_size (int): The number of characters per read.
+
+    Returns:
+    An iterator of strings.
+    """
+    with open(file_name, 'r') as file:
+        pieces = []
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            if '\n' not in chunk:
+                pieces.append(chunk)
+                continue
+            pieces.append(chunk)
+            lines = ''.join(pieces).split('\n')
+            pieces = [lines.pop()]
+            for line in lines:
+                yield from _line_words(line)
+        yield from _line_words(''.join(pieces))
+
+def _line_words(line):
+    """
+    Yield the words of one line. A punctuation mark standing
+    on its own is joined to the word before it, and one at the
+    start of the line is dropped.
+
+    Parameters:
+    line (str): The line to be split.
 
-def build_markov_chain(text, prefix_size, hash_table_size):
+    Returns:
+    An iterator of strings.
+    """
+    words = line.split()
+    for i, word in enumerate(words):
+        if i < len(words) - 1 and words[i+1] in PUNCTUATION:
+            yield word + words[i+1]
+            words[i+1] = ""
+        elif word not in PUNCTUATION:
+            yield word
+
+def build_markov_chain(text, prefix_size, hash_table_size,
+                       max_load_factor=MAX_LOAD_FACTOR, compact=False,
+                       instrument=False):
     """
     Build a Markov chain from a list of words.
 
     Parameters:
-    text (list of str): The list of words from which to
-        build the chain.
+    text (iterable of str): The words from which to build
+        the chain, such as a list from read_file or the
+        iterator from iter_words.
     prefix_size (int): The number of words in the prefix.
-    hash_table_size (int): The size of the hashtable to 
-        be used.
+    hash_table_size (int): The initial size of the hashtable
+        to be used.
+    max_load_factor (float): The load factor at which the
+        hashtable grows. None keeps hash_table_size as a
+        hard limit.
+    compact (bool): Build a CompactChain instead, which
+        always grows its index as needed.
+    instrument (bool): Keep a HashtableStats in
+        markov_chain.table.stats. Ignored for a CompactChain.
 
     Returns:
-    A Hashtable object representing the Markov chain.
+    A MarkovChain or CompactChain object.
     """
-    markov_chain = Hashtable(hash_table_size)
-    prefix = (NONWORD,) * prefix_size
+    if compact:
+        markov_chain = CompactChainBuilder(prefix_size, hash_table_size)
+    else:
+        markov_chain = MarkovChain(
+            prefix_size, hash_table_size, max_load_factor, instrument)
+    vocabulary = markov_chain.vocabulary
+    prefix = markov_chain.start()
     for word in text:
-        key = ' '.join(prefix).strip()
-        if key in markov_chain:
-            markov_chain.get(key).append(word)
-        else:
-            markov_chain.put(key, word)
-        # print(f"Adding suffix '{word}' to prefix '{key}'")  
-        # print(f"Current state of Hashtable: {markov_chain}")
-        prefix = prefix[1:] + (word,)
+        word_id = vocabulary.intern(word)
+        markov_chain.add(prefix, word_id)
+        prefix.shift(word_id)
+    if compact:
+        return markov_chain.build()
     return markov_chain
 
-def generate_text(chain, prefix_size, word_count):
+def build_markov_chain_parallel(text, prefix_size, hash_table_size,
+                                workers=None, shard_size=SHARD_SIZE):
+    """
+    Build a CompactChain using several processes, in three
+    rounds of work that the main process only joins up.
+
+    1. Each shard of shard_size words is interned by a worker
+       into its own small vocabulary. The main process interns
+       just those distinct words, in order, so the word ids
+       are the ones build_markov_chain gives, and sends back
+       a table from shard ids to them.
+    2. A worker numbers the prefixes of each shard, with the
+       prefix_size word ids before it so the transitions
+       across shard boundaries are neither lost nor counted
+       twice, and splits them, with their suffixes grouped,
+       into one part per worker by key_hash % workers.
+    3. Worker p merges part p of every shard in text order
+       into its own prefix table and suffix arrays.
+
+    The main process then concatenates the arrays of the
+    parts into a PrefixIndex with one stride of slots per
+    part. The chain has the same transitions as
+    build_markov_chain(..., compact=True), with the suffixes
+    of each prefix in text order, so it generates the same
+    text; only the prefixes are numbered part by part.
+
+    Parameters:
+    text (iterable of str): The words from which to build
+        the chain.
+    prefix_size (int): The number of words in the prefix.
+    hash_table_size (int): The smallest number of slots of
+        the prefix index.
+    workers (int): The number of worker processes, or None
+        for one per CPU.
+    shard_size (int): The number of words per shard.
+
+    Returns:
+    A CompactChain object.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    text = iter(text)
+    vocabulary = Vocabulary()
+    window = collections.deque([0] * prefix_size, maxlen=prefix_size)
+    interned = collections.deque()
+    shards = []
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+
+        def split(future):
+            words, word_ids = future.result()
+            ids = array('I', map(vocabulary.intern, words))
+            shards.append(executor.submit(
+                _split_shard, word_ids, ids, tuple(window), prefix_size,
+                workers))
+            window.extend(ids[word_id] for word_id in word_ids[-prefix_size:])
+
+        while True:
+            shard = list(itertools.islice(text, shard_size))
+            if not shard:
+                break
+            interned.append(executor.submit(_intern_shard, shard))
+            if len(interned) > 2 * workers:
+                split(interned.popleft())
+        while interned:
+            split(interned.popleft())
+        parts = [future.result() for future in shards]
+        # The suffixes of part p follow those of parts 0 to p - 1.
+        suffix_bases = [0]
+        for p in range(workers):
+            suffix_bases.append(suffix_bases[-1] + sum(
+                len(part[p][3]) for part in parts))
+        # Every part gets as many slots as the largest may need.
+        largest = max([sum(len(part[p][1]) for part in parts)
+                       for p in range(workers)], default=0)
+        size = max(int(largest / MAX_LOAD_FACTOR) + 1,
+                   -(-hash_table_size // workers))
+        merged = [executor.submit(
+            _merge_part, [part[p] for part in parts], prefix_size, workers,
+            size, suffix_bases[p]) for p in range(workers)]
+        del parts
+        slots = array('q', [-1]) * (size * workers)
+        prefix_words = array('I')
+        offsets = array('Q')
+        suffixes = array('I')
+        bases = array('Q')
+        for p, future in enumerate(merged):
+            part_slots, part_words, part_offsets, part_suffixes = \
+                future.result()
+            bases.append(len(prefix_words) // max(prefix_size, 1))
+            slots[p::workers] = part_slots
+            prefix_words.extend(part_words)
+            offsets.extend(part_offsets)
+            suffixes.extend(part_suffixes)
+    offsets.append(len(suffixes))
+    index = PrefixIndex.from_arrays(prefix_size, slots, prefix_words, bases)
+    return CompactChain(prefix_size, vocabulary, index, offsets, suffixes)
+
+def _intern_shard(words):
+    """
+    Intern the words of one shard into a vocabulary of their
+    own. Runs in a worker process.
+
+    Returns:
+    A tuple of the distinct words in the order they first
+    appear and the shard as an array of their positions.
+    """
+    ids = {}
+    word_ids = array('I', [ids.setdefault(word, len(ids)) for word in words])
+    return list(ids), word_ids
+
+def _split_shard(word_ids, ids, overlap, prefix_size, parts):
+    """
+    Number the prefixes of one shard in the order they first
+    appear and split them by key_hash % parts. Runs in a worker
+    process.
+
+    Parameters:
+    word_ids (array of int): The shard in the ids of
+        _intern_shard.
+    ids (array of int): The chain's word id of each of them.
+    overlap (tuple of int): The prefix_size word ids before
+        the shard.
+    prefix_size (int): The number of words in the prefix.
+    parts (int): The number of parts.
+
+    Returns:
+    A list with, for every part, a tuple of the word ids of
+    its prefixes, their hashes, and the offsets and suffixes
+    of the prefixes with the suffixes grouped by prefix in
+    text order.
+    """
+    numbers = {}
+    hashes = []
+    prefixes = array('I')
+    suffixes = array('I', map(ids.__getitem__, word_ids))
+    prefix = RollingPrefix(prefix_size, 0)
+    for word_id in overlap:
+        prefix.shift(word_id)
+    for word_id in suffixes:
+        key = prefix.key()
+        number = numbers.get(key)
+        if number is None:
+            number = numbers[key] = len(hashes)
+            hashes.append(prefix.key_hash())
+        prefixes.append(number)
+        prefix.shift(word_id)
+    counts = [0] * len(hashes)
+    for number in prefixes:
+        counts[number] += 1
+    split = [(array('I'), array('Q'), array('Q', [0]))
+             for _ in range(parts)]
+    # Where the next suffix of each prefix goes in its part.
+    ends = []
+    for key, number in numbers.items():
+        key_hash = hashes[number]
+        prefix_words, part_hashes, offsets = split[key_hash % parts]
+        prefix_words.extend(key)
+        part_hashes.append(key_hash)
+        ends.append(offsets[-1])
+        offsets.append(offsets[-1] + counts[number])
+    split = [(prefix_words, part_hashes, offsets,
+              array('I', [0]) * offsets[-1])
+             for prefix_words, part_hashes, offsets in split]
+    targets = [split[key_hash % parts][3] for key_hash in hashes]
+    for number, word_id in zip(prefixes, suffixes):
+        targets[number][ends[number]] = word_id
+        ends[number] += 1
+    return split
+
+def _merge_part(pieces, prefix_size, parts, size, suffix_base):
+    """
+    Merge one part of every shard, in text order, into a
+    prefix table with the given number of slots and grouped
+    suffix arrays. Runs in a worker process.
+
+    Parameters:
+    pieces (list): The part's tuple from _split_shard for
+        every shard.
+    prefix_size (int): The number of words in the prefix.
+    parts (int): The number of parts.
+    size (int): The number of slots, more than the part's
+        prefixes.
+    suffix_base (int): The number of suffixes in the parts
+        before this one.
+
+    Returns:
+    A tuple of the slot table, the word ids of the prefixes,
+    the offset of each prefix's suffixes in the whole chain,
+    and the suffixes grouped by prefix.
+    """
+    index = PrefixIndex(prefix_size, size)
+    merged_numbers = {}
+    counts = []
+    numbers = []
+    for prefix_words, hashes, offsets, _ in pieces:
+        shard_numbers = array('I')
+        for number, key_hash in enumerate(hashes):
+            start = number * prefix_size
+            key = tuple(prefix_words[start:start + prefix_size])
+            merged = merged_numbers.get(key)
+            if merged is None:
+                merged = merged_numbers[key] = len(counts)
+                counts.append(0)
+                index._words.extend(key)
+                # The hash within the part's stride of slots.
+                index._place(merged, key_hash // parts)
+            counts[merged] += offsets[number + 1] - offsets[number]
+            shard_numbers.append(merged)
+        numbers.append(shard_numbers)
+    ends = array('Q', [0]) * len(counts)
+    for number in range(1, len(counts)):
+        ends[number] = ends[number - 1] + counts[number - 1]
+    merged_offsets = array('Q', [end + suffix_base for end in ends])
+    suffixes = array('I', [0]) * sum(counts)
+    for (_, _, offsets, shard_suffixes), shard_numbers in zip(pieces, numbers):
+        for number, merged in enumerate(shard_numbers):
+            start = offsets[number]
+            stop = offsets[number + 1]
+            end = ends[merged]
+            suffixes[end:end + stop - start] = shard_suffixes[start:stop]
+            ends[merged] = end + stop - start
+    return index._slots, index._words, merged_offsets, suffixes
+
+def generate_text(chain, prefix_size, word_count, rng=None):
     """
     Generate text using a Markov chain.
 
     Parameters:
-    chain (Hashtable): The Markov chain to be 
-        used for text generation.
+    chain (MarkovChain, CompactChain or CompiledChain): The
+        Markov chain to be used for text generation.
     prefix_size (int): The number of words in the prefix.
     word_count (int): The number of words to generate.
+    rng (random.Random): The source of randomness, or None
+        for the module's random state seeded with SEED.
 
     Returns:
     A string of generated text.
     """
-    prefix = (NONWORD,) * prefix_size
-    generated_words = []
-    for _ in range(word_count):
-        key = ' '.join(prefix).strip()
-        suffixes = chain.get(key)
-        if suffixes is None:
-            break
-        word = suffixes[random.randint(
-            0, len(suffixes) - 1)] if len(suffixes) > 1 else suffixes[0]
-        generated_words.append(word)
-        new_prefix_words = (key + ' ' + word).split()[-prefix_size:]
-        prefix = tuple(new_prefix_words)
+    generated_words = list(
+        iter_generated_words(chain, prefix_size, word_count, rng))
     text_lines = [' '.join(generated_words[i:i+10]) \
         for i in range(0, len(generated_words), 10)]
     return '\n'.join(text_lines)
 
+def iter_generated_words(chain, prefix_size, word_count, rng=None):
+    """
+    Generate words using a Markov chain, one at a time.
+
+    Parameters:
+    chain (MarkovChain, CompactChain or CompiledChain): The
+        Markov chain to be used for text generation.
+    prefix_size (int): The number of words in the prefix.
+    word_count (int): The number of words to generate.
+    rng (random.Random): The source of randomness, or None
+        for the module's random state seeded with SEED.
+
+    Returns:
+    An iterator of strings, which may be empty words.
+    """
+    if rng is None:
+        rng = random
+    vocabulary = chain.vocabulary
+    prefix = chain.start()
+    for _ in range(word_count):
+        word_id = chain.choose(prefix, rng)
+        if word_id is None:
+            return
+        word = vocabulary.word(word_id)
+        yield word
+        # Empty words never enter the prefix, just like when
+        # the prefix was re-split from the joined key.
+        if word:
+            prefix.shift(word_id)
+
+def iter_text_lines(words):
+    """
+    Group words into lines of 10 the way print_text does,
+    leaving out empty words.
+
+    Parameters:
+    words (iterable of str): The words to be grouped.
+
+    Returns:
+    An iterator of strings, one per line.
+    """
+    line = []
+    for word in words:
+        if word:
+            line.append(word)
+            if len(line) == 10:
+                yield ' '.join(line)
+                line = []
+    if line:
+        yield ' '.join(line)
+
+def write_generated_text(chain, prefix_size, word_count, stream=None,
+                         rng=None):
+    """
+    Generate text and write it to a stream line by line, as
+    print_text(generate_text(...)) would print it, without
+    holding the whole text in memory.
+
+    Parameters:
+    chain (MarkovChain, CompactChain or CompiledChain): The
+        Markov chain to be used for text generation.
+    prefix_size (int): The number of words in the prefix.
+    word_count (int): The number of words to generate.
+    stream (file): The stream to write to, or None for
+        sys.stdout.
+    rng (random.Random): The source of randomness, or None
+        for the module's random state seeded with SEED.
+    """
+    if stream is None:
+        stream = sys.stdout
+    words = iter_generated_words(chain, prefix_size, word_count, rng)
+    for line in iter_text_lines(words):
+        stream.write(line + '\n')
+
+def iter_generated_texts(chain, prefix_size, word_count, seeds):
+    """
+    Generate one text per seed, one at a time. Each text gets
+    its own random.Random, so it only depends on its seed.
+
+    Parameters:
+    chain (MarkovChain, CompactChain or CompiledChain): The
+        Markov chain to be used for text generation.
+    prefix_size (int): The number of words in the prefix.
+    word_count (int): The number of words per text.
+    seeds (iterable): The seeds, one per text.
+
+    Returns:
+    An iterator of strings of generated text.
+    """
+    for seed in seeds:
+        yield generate_text(
+            chain, prefix_size, word_count, random.Random(seed))
+
+def generate_texts(chain, prefix_size, word_count, seeds, workers=None):
+    """
+    Generate one text per seed, spread over worker processes.
+    The chain is sent to each worker once, when it starts, and
+    a chain loaded with load_chain is mapped from its file
+    instead. The texts are the same as from
+    iter_generated_texts.
+
+    Parameters:
+    chain (MarkovChain, CompactChain or CompiledChain): The
+        Markov chain to be used for text generation.
+    prefix_size (int): The number of words in the prefix.
+    word_count (int): The number of words per text.
+    seeds (iterable): The seeds, one per text.
+    workers (int): The number of worker processes, or None
+        for one per CPU.
+
+    Returns:
+    A list of strings of generated text, in seed order.
+    """
+    with concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=_set_worker_chain,
+            initargs=(chain,)) as executor:
+        return list(executor.map(
+            _generate_in_worker, seeds, itertools.repeat(prefix_size),
+            itertools.repeat(word_count), chunksize=GENERATE_CHUNK_SIZE))
+
+_worker_chain = None
+
+def _set_worker_chain(chain):
+    """
+    Keep the chain of a generate_texts worker process.
+    """
+    global _worker_chain
+    _worker_chain = chain
+
+def _generate_in_worker(seed, prefix_size, word_count):
+    """
+    Generate the text for one seed in a generate_texts worker.
+    """
+    return generate_text(
+        _worker_chain, prefix_size, word_count, random.Random(seed))
+
 
 def print_text(text):
     """
@@ -213,7 +1669,40 @@ def print_text(text):
     for i in range(0, len(words), 10):
         print(' '.join(words[i:i+10]))
 
-def main():
+def parse_args(argv=None):
+    """
+    Parse the command line options. The source file and sizes
+    are still read from standard input.
+
+    Parameters:
+    argv (list of str): The arguments to parse, or None for
+        sys.argv.
+
+    Returns:
+    An argparse.Namespace with the options.
+    """
+    parser = argparse.ArgumentParser(
+        description="Generate random text from a Markov chain.")
+    parser.add_argument(
+        "--compact", action="store_true",
+        help="store the chain in flat arrays to save memory")
+    parser.add_argument(
+        "--compiled", action="store_true",
+        help="sample suffixes from precomputed alias tables")
+    parser.add_argument(
+        "--model", metavar="PATH",
+        help="load the chain from this model file if it exists, "
+             "otherwise build it and save it there")
+    parser.add_argument(
+        "--jobs", type=int, metavar="N",
+        help="build the chain in compact form with N processes")
+    args = parser.parse_args(argv)
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("N must be at least 1")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
     sfile = input()
     hash_table_size = int(input())
     prefix_size = int(input())
@@ -229,12 +1718,28 @@ def main():
             "ERROR: specified size of the generated text is less than one")
         sys.exit(0)
 
-    text = read_file(sfile)
-    markov_chain = build_markov_chain(
-        text, prefix_size, hash_table_size)
-    generated_text = generate_text(
-        markov_chain, prefix_size, number_of_words)
-    print_text(generated_text)
+    if args.model is not None and os.path.exists(args.model):
+        markov_chain = load_chain(args.model)
+        if markov_chain.prefix_size != prefix_size:
+            print("ERROR: prefix size of the model is",
+                  markov_chain.prefix_size)
+            sys.exit(0)
+        if args.compiled and not isinstance(markov_chain, CompiledChain):
+            markov_chain = compile_chain(markov_chain)
+    else:
+        text = iter_words(sfile)
+        if args.jobs is not None:
+            markov_chain = build_markov_chain_parallel(
+                text, prefix_size, hash_table_size, args.jobs)
+        else:
+            markov_chain = build_markov_chain(
+                text, prefix_size, hash_table_size,
+                compact=args.compact or args.model is not None)
+        if args.compiled:
+            markov_chain = compile_chain(markov_chain)
+        if args.model is not None:
+            save_chain(markov_chain, args.model)
+    write_generated_text(markov_chain, prefix_size, number_of_words)
 
 if __name__ == "__main__":
     main()